@@ -0,0 +1,237 @@
+"""ASGI-приложение поверх обработчика Django.
+
+Django 2.2 не умеет асинхронных представлений и ORM, а перейти на 3.x
+проект не может (тесты требуют Django < 3.0). Поэтому асинхронным
+сделан обмен с клиентом: тело запроса читается и ответ отправляется
+в цикле событий, а представление вместе с middleware выполняется
+в пуле из `ASGI_THREADS` потоков. Медленный клиент держит только
+соединение, а не поток с соединением к базе; поток занят лишь на время
+работы представления.
+
+Потоковый ответ (выгрузка, файл, server-sent events) от начала до
+закрытия читается одним потоком отдельного пула из
+`ASGI_STREAM_THREADS`: курсор .iterator() и закрытие соединения
+в `request_finished` относятся к соединению этого потока, а долгие
+потоки не занимают пул, который отрисовывает страницы. Куски передаются
+в цикл событий через очередь из STREAM_QUEUE_SIZE элементов: пока
+клиент не заберёт их, поток ждёт.
+"""
+import asyncio
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import close_old_connections
+
+CHUNK_SIZE = 64 * 1024
+STREAM_QUEUE_SIZE = 4  # Сколько кусков потока ждут отправки клиенту
+# Ключ WSGI-окружения, по которому видно, что запрос пришёл через ASGI
+ENVIRON_KEY = 'yatube.asgi'
+
+
+def streams_enabled(request):
+    """Можно ли открывать долгие потоки: под WSGI каждый из них занял
+    бы рабочий процесс или поток сервера."""
+    return request.META.get(ENVIRON_KEY, False)
+
+
+def build_environ(scope, body):
+    """WSGI-окружение запроса из ASGI scope."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI передаёт путь байтами в latin-1, Django декодирует его
+        # как UTF-8
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        ENVIRON_KEY: True,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    return environ
+
+
+def _read_chunk(iterator, size):
+    """Следующий кусок потокового ответа, b'' - ответ закончился."""
+    chunk = b''
+    for part in iterator:
+        chunk += part
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+class AsgiHandler:
+    def __init__(self, threads=None, stream_threads=None):
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or settings.ASGI_THREADS,
+            thread_name_prefix='asgi',
+        )
+        self.stream_executor = ThreadPoolExecutor(
+            max_workers=stream_threads or settings.ASGI_STREAM_THREADS,
+            thread_name_prefix='asgi-stream',
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(
+                f'Неподдерживаемый тип соединения {scope["type"]!r}'
+            )
+        body = await self.read_body(receive)
+        if body is None:
+            return  # Клиент ушёл, не дождавшись ответа
+        try:
+            await self.respond(scope, body, send)
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.stream_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """Тело запроса; большие тела, как и загрузки Django,
+        уходят во временный файл."""
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return body
+
+    def handle(self, scope, body):
+        """Обрабатывает запрос в потоке пула. Обычный ответ читается
+        здесь же целиком, потоковый возвращается для чтения кусками."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        response = self.wsgi(build_environ(scope, body), start_response)
+        if response.streaming:
+            # Поток читает своё соединение, а соединение этого потока
+            # запросу больше не нужно
+            close_old_connections()
+            return started['status'], started['headers'], None, response
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        return started['status'], started['headers'], content, None
+
+    async def respond(self, scope, body, send):
+        loop = asyncio.get_running_loop()
+        status, headers, content, response = await loop.run_in_executor(
+            self.executor, self.handle, scope, body
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        if response is None:
+            await send({'type': 'http.response.body', 'body': content})
+            return
+        # События отправляются сразу, не дожидаясь полного куска
+        event_stream = response.get('Content-Type', '').startswith(
+            'text/event-stream'
+        )
+        size = 1 if event_stream else CHUNK_SIZE
+        queue = asyncio.Queue(STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+        job = loop.run_in_executor(
+            self.stream_executor,
+            self.stream, response, size, loop, queue, stop,
+        )
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        finally:
+            stop.set()
+            while not job.done():
+                # Поток может ждать места в очереди
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait({job}, timeout=0.05)
+        await job
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def stream(self, response, size, loop, queue, stop):
+        """Читает потоковый ответ и закрывает его в одном потоке.
+        Куски кладутся в очередь цикла событий, None - конец ответа."""
+        try:
+            iterator = iter(response)
+            while not stop.is_set():
+                chunk = _read_chunk(iterator, size)
+                if not chunk:
+                    break
+                asyncio.run_coroutine_threadsafe(
+                    queue.put(chunk), loop
+                ).result()
+        finally:
+            try:
+                response.close()
+            finally:
+                asyncio.run_coroutine_threadsafe(
+                    queue.put(None), loop
+                ).result()
+
+
+def get_asgi_application():
+    """Как django.core.wsgi.get_wsgi_application, но для ASGI."""
+    django.setup(set_prefix=False)
+    return AsgiHandler()
@@ -0,0 +1,129 @@
+"""Публикация событий подписчикам внутри процесса.
+
+Подписка слушает несколько каналов и копит сообщения в очереди
+ограниченной длины (`STREAM_BUFFER_SIZE`): если подписчик не успевает
+их забирать, старые сообщения вытесняются, а издатель никогда не ждёт.
+Число подписок ограничено в целом (`STREAM_MAX_CONNECTIONS`) и для
+одного клиента (`STREAM_MAX_PER_CLIENT`).
+
+Брокер живёт в памяти процесса: подписчики получают события только
+о записях, сделанных тем же процессом. Если сервер запущен в нескольких
+процессах, пост, созданный в одном из них, не дойдёт до подписчиков
+остальных; для этого брокер нужно заменить внешним (например, pub/sub
+в Redis) с тем же интерфейсом subscribe и publish.
+"""
+import threading
+from collections import Counter, deque
+
+from django.conf import settings
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class ClientLimitExceeded(TooManySubscribers):
+    pass
+
+
+class Subscription:
+    def __init__(self, broker, channels, client, buffer_size):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self.client = client
+        self.dropped = 0  # Сколько сообщений вытеснено из очереди
+        self.closed = False
+        self._messages = deque(maxlen=buffer_size)
+        self._ready = threading.Condition()
+
+    def put(self, message):
+        with self._ready:
+            if len(self._messages) == self._messages.maxlen:
+                self.dropped += 1
+            self._messages.append(message)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Следующее сообщение или None, если за timeout секунд ничего
+        не пришло или подписка закрыта."""
+        with self._ready:
+            self._ready.wait_for(
+                lambda: self._messages or self.closed, timeout
+            )
+            if self._messages:
+                return self._messages.popleft()
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+        with self._ready:
+            self._ready.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}  # Канал -> множество подписок
+        self._clients = Counter()
+        self._count = 0
+
+    @property
+    def subscribers(self):
+        return self._count
+
+    def subscribe(self, channels, client=None):
+        """Подписка на каналы. client - кто подписывается, для
+        ограничения числа подписок одного клиента."""
+        with self._lock:
+            if self._count >= settings.STREAM_MAX_CONNECTIONS:
+                raise TooManySubscribers('Слишком много подписчиков')
+            if (
+                client is not None
+                and self._clients[client] >= settings.STREAM_MAX_PER_CLIENT
+            ):
+                raise ClientLimitExceeded(
+                    f'Слишком много подписок у {client}'
+                )
+            subscription = Subscription(
+                self, channels, client, settings.STREAM_BUFFER_SIZE
+            )
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+            self._count += 1
+            if client is not None:
+                self._clients[client] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            for channel in subscription.channels:
+                subscriptions = self._channels[channel]
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._channels[channel]
+            self._count -= 1
+            if subscription.client is not None:
+                self._clients[subscription.client] -= 1
+                if not self._clients[subscription.client]:
+                    del self._clients[subscription.client]
+
+    def publish(self, channel, message):
+        """Отправляет сообщение подписчикам канала. Возвращает их
+        число."""
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+        return len(subscriptions)
+
+
+broker = Broker()
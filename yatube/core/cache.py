@@ -0,0 +1,132 @@
+"""Двухуровневый кэш.
+
+`TieredCache` хранит значения в общем для всех процессов кэше
+(memcached), указанном в LOCATION как псевдоним из CACHES, а горячие
+ключи ещё и в небольшом LRU в памяти процесса. Общий кэш должен
+атомарно выполнять incr и add, иначе одновременные смены версий
+теряются: файловый кэш и кэш в базе для этого не годятся (см.
+core.checks). Локальная копия живёт не
+дольше LOCAL_TIMEOUT секунд: на этот срок другие процессы могут не
+увидеть изменение, сделанное в одном из них. Свои изменения процесс
+видит сразу.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 5},
+        },
+        'shared': {...},
+    }
+"""
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Локальный уровень общий для потоков процесса, как у LocMemCache
+_locals = {}
+_locks = {}
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 5))
+        self._local = _locals.setdefault(location, OrderedDict())
+        self._lock = _locks.setdefault(location, Lock())
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """Кладёт значение в локальный уровень. Значения хранятся
+        сериализованными, чтобы изменения полученного объекта
+        не попадали в кэш."""
+        local_timeout = self._local_timeout
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is not None:
+            local_timeout = min(local_timeout, timeout - time.time())
+        if local_timeout <= 0:
+            self._forget(key)
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._local[key] = (time.monotonic() + local_timeout, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return _MISSING
+            expires, pickled = item
+            if expires <= time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _forget(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(self.make_key(key, version), value, timeout)
+        else:
+            self._forget(self.make_key(key, version))
+        return added
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        self.validate_key(local_key)
+        value = self._recall(local_key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._remember(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(self.make_key(key, version), value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self._forget(self.make_key(key, version))
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._remember(self.make_key(key, version), value)
+        return value
+
+    def has_key(self, key, version=None):
+        if self._recall(self.make_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Бэкенды, в которых incr и add - отдельные чтение и запись
+NON_ATOMIC_CACHES = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+)
+
+
+@register()
+def stream_limits(app_configs, **kwargs):
+    """Каждый поток новых постов занимает поток ASGI_STREAM_THREADS:
+    при большем числе соединений выгрузки и потоки ждали бы в очереди."""
+    if settings.STREAM_MAX_CONNECTIONS < settings.ASGI_STREAM_THREADS:
+        return []
+    return [Error(
+        'STREAM_MAX_CONNECTIONS должно быть меньше ASGI_STREAM_THREADS',
+        hint='Каждое соединение потока занимает поток ASGI_STREAM_THREADS',
+        id='core.E001',
+    )]
+
+
+@register()
+def shared_cache(app_configs, **kwargs):
+    """Общий уровень TieredCache должен атомарно выполнять incr."""
+    errors = []
+    for alias, options in settings.CACHES.items():
+        if options['BACKEND'] != 'core.cache.TieredCache':
+            continue
+        shared = settings.CACHES.get(options['LOCATION'], {})
+        if shared.get('BACKEND') in NON_ATOMIC_CACHES:
+            errors.append(Error(
+                f'Общий уровень кэша {alias!r} не выполняет incr '
+                'атомарно',
+                hint='Укажите в нём memcached',
+                id='core.E002',
+            ))
+    return errors
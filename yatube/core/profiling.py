@@ -0,0 +1,225 @@
+"""Профилирование запросов.
+
+`ProfilingMiddleware` для доли запросов, заданной настройкой
+`PROFILING_SAMPLE_RATE`, считает запросы к базе и их время, повторяющиеся
+запросы, время отрисовки шаблонов, попадания и промахи кэша. Итоги
+уходят в заголовок `Server-Timing`, в лог `core.profiling` и в сводку
+по представлениям, которую отдаёт `core.views.profiling_stats`.
+Запросы вне выборки проходят без лишней работы, а пока профилирование
+выключено, отрисовка шаблонов не подменяется вовсе: её замер ставит
+`install()` при запуске приложения или при смене настройки.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('profile', default=None)
+_MISSING = object()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicates(self):
+        """Сколько запросов повторили уже выполненный с теми же
+        параметрами."""
+        return sum(count - 1 for count in self.queries.values())
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries[(sql, repr(params))] += 1
+
+    def server_timing(self):
+        return ', '.join((
+            'sql;dur={:.1f};desc="{} queries, {} duplicates"'.format(
+                self.sql_time * 1000, self.query_count, self.duplicates
+            ),
+            'tpl;dur={:.1f}'.format(self.template_time * 1000),
+            'cache;desc="{} hits, {} misses"'.format(
+                self.cache_hits, self.cache_misses
+            ),
+            'total;dur={:.1f}'.format(self.total_time * 1000),
+        ))
+
+
+def _render(self, *args, **kwargs):
+    profile = _current.get()
+    if profile is None:
+        return _original_render(self, *args, **kwargs)
+    started = time.perf_counter()
+    try:
+        return _original_render(self, *args, **kwargs)
+    finally:
+        profile.template_time += time.perf_counter() - started
+
+
+_original_render = Template.render
+
+
+def install():
+    """Включает замер времени отрисовки шаблонов. Вложенные шаблоны
+    отрисовываются внутри замеренного вызова, поэтому время
+    не считается дважды."""
+    Template.render = _render
+
+
+def uninstall():
+    Template.render = _original_render
+
+
+def _profiled_caches():
+    """Псевдонимы кэшей для подсчёта попаданий: общий уровень
+    TieredCache не считается, иначе обращение, которое локальный
+    уровень не обслужил, было бы учтено дважды."""
+    tiers = {
+        params.get('LOCATION')
+        for params in settings.CACHES.values()
+        if params['BACKEND'] == 'core.cache.TieredCache'
+    }
+    return [alias for alias in settings.CACHES if alias not in tiers]
+
+
+def _instrument_cache(stack, cache, profile):
+    """Подменяет get и get_many у экземпляра кэша текущего потока."""
+    original_get = cache.get
+    original_get_many = cache.get_many
+
+    def get(key, default=None, version=None):
+        value = original_get(key, _MISSING, version=version)
+        if value is _MISSING:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    def get_many(keys, version=None):
+        keys = list(keys)
+        values = original_get_many(keys, version=version)
+        profile.cache_hits += len(values)
+        profile.cache_misses += len(keys) - len(values)
+        return values
+
+    cache.get = get
+    cache.get_many = get_many
+    stack.callback(vars(cache).pop, 'get_many')
+    stack.callback(vars(cache).pop, 'get')
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    return match.view_name
+
+
+def record(endpoint, profile, status):
+    """Добавляет запрос в сводку и пишет его в лог."""
+    total = profile.total_time
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {
+            'requests': 0, 'total_time': 0.0, 'max_time': 0.0,
+            'queries': 0, 'sql_time': 0.0, 'duplicates': 0,
+            'template_time': 0.0, 'cache_hits': 0, 'cache_misses': 0,
+        })
+        stats['requests'] += 1
+        stats['total_time'] += total
+        stats['max_time'] = max(stats['max_time'], total)
+        stats['queries'] += profile.query_count
+        stats['sql_time'] += profile.sql_time
+        stats['duplicates'] += profile.duplicates
+        stats['template_time'] += profile.template_time
+        stats['cache_hits'] += profile.cache_hits
+        stats['cache_misses'] += profile.cache_misses
+    logger.info(
+        '%s %s %.1f ms, %s queries (%s duplicates) %.1f ms, '
+        'templates %.1f ms, cache %s/%s',
+        endpoint, status, total * 1000, profile.query_count,
+        profile.duplicates, profile.sql_time * 1000,
+        profile.template_time * 1000, profile.cache_hits,
+        profile.cache_hits + profile.cache_misses,
+    )
+
+
+def summary():
+    """Средние показатели по представлениям, времена в миллисекундах."""
+    with _stats_lock:
+        items = [(endpoint, dict(stats)) for endpoint, stats in _stats.items()]
+    result = {}
+    for endpoint, stats in sorted(items):
+        count = stats['requests']
+        result[endpoint] = {
+            'requests': count,
+            'mean_ms': round(stats['total_time'] / count * 1000, 3),
+            'max_ms': round(stats['max_time'] * 1000, 3),
+            'queries': round(stats['queries'] / count, 2),
+            'sql_ms': round(stats['sql_time'] / count * 1000, 3),
+            'duplicates': round(stats['duplicates'] / count, 2),
+            'template_ms': round(stats['template_time'] / count * 1000, 3),
+            'cache_hits': stats['cache_hits'],
+            'cache_misses': stats['cache_misses'],
+        }
+    return result
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PROFILING_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        profile = Profile()
+        token = _current.set(profile)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(profile.record_query)
+                )
+            for alias in _profiled_caches():
+                _instrument_cache(stack, caches[alias], profile)
+            try:
+                response = self.get_response(request)
+            finally:
+                _current.reset(token)
+        response['Server-Timing'] = profile.server_timing()
+        record(_endpoint(request), profile, response.status_code)
+        return response
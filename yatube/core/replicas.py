@@ -0,0 +1,96 @@
+"""Чтение из реплик базы данных.
+
+`ReplicaMiddleware` разрешает читать из реплик, перечисленных
+в настройке `DATABASE_REPLICAS`, только запросам на чтение (GET, HEAD,
+OPTIONS). Запрос, который что-то записал в базу, ставит cookie, и
+следующие `REPLICA_PIN_SECONDS` секунд запросы этого пользователя
+читают из основной базы: он сразу видит свои изменения, даже если
+реплика ещё не догнала основную базу.
+
+Вне запросов (команды, фоновые задачи) и внутри транзакций всё
+читается из основной базы. Блок `primary()` тоже читает из неё: так
+заполняются записи кэша сразу после смены версии, чтобы отставшая
+реплика не закэшировала старые данные под новой версией.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state['replica']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # В транзакции читаем то, что только что записали
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state['wrote'] = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными из основной базы
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+@contextmanager
+def primary():
+    """Запросы внутри блока читают из основной базы."""
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    replica = state['replica']
+    state['replica'] = False
+    try:
+        yield
+    finally:
+        state['replica'] = replica
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = {
+            'replica': (
+                request.method in SAFE_METHODS
+                and PIN_COOKIE not in request.COOKIES
+            ),
+            'wrote': False,
+        }
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state['wrote']:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
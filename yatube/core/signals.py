@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import profiling
+
+
+@receiver(connection_created)
+def sqlite_pragmas(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite прагмами
+    из настройки SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            if not name.isidentifier():
+                raise ValueError(f'Недопустимое имя прагмы: {name!r}')
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(setting_changed)
+def profiling_sample_rate(sender, setting, value, **kwargs):
+    """Ставит или снимает замер шаблонов, когда меняется
+    PROFILING_SAMPLE_RATE (например, в тестах)."""
+    if setting != 'PROFILING_SAMPLE_RATE':
+        return
+    if value:
+        profiling.install()
+    else:
+        profiling.uninstall()
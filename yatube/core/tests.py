@@ -1,6 +1,32 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Executor, Future
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.backends.django import Template
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+
+from posts.models import Post
+from . import asgi, checks, profiling
+from .asgi import AsgiHandler, build_environ
+from .broker import Broker, ClientLimitExceeded, TooManySubscribers
+from .replicas import PIN_COOKIE
+from .throttling import client_ip, consume, parse_rate
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +34,580 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        profiling.reset()
+
+    def test_not_sampled(self):
+        """При нулевой доле выборки запрос не профилируется."""
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.summary(), {})
+        # Отрисовка шаблонов не подменена
+        self.assertIs(Template.render, profiling._original_render)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        """Профилированный запрос отдаёт Server-Timing и попадает
+        в сводку."""
+        with self.assertLogs('core.profiling', 'INFO'):
+            response = self.client.get('/')
+        timing = response['Server-Timing']
+        for metric in ('sql;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            self.assertIn(metric, timing)
+        stats = profiling.summary()['posts:index']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['queries'], 0)
+        self.assertGreater(stats['template_ms'], 0)
+        self.assertGreater(stats['cache_misses'], 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, CACHES={
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'profiling-tests',
+        },
+    })
+    def test_tiered_cache_counted_once(self):
+        """Обращение к двухуровневому кэшу учитывается один раз,
+        даже если его обслужил общий уровень."""
+        caches['shared'].set('shared', 'value')
+
+        def view(request):
+            caches['default'].get('shared')
+            caches['default'].get('missing')
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(view)
+        with self.assertLogs('core.profiling', 'INFO'):
+            response = middleware(RequestFactory().get('/'))
+        self.assertIn(
+            'cache;desc="1 hits, 1 misses"', response['Server-Timing']
+        )
+
+    def test_duplicates(self):
+        """Повтор запроса с теми же параметрами считается дублем."""
+        profile = profiling.Profile()
+
+        def execute(sql, params, many, context):
+            return None
+
+        for params in ((1,), (1,), (2,)):
+            profile.record_query(execute, 'SELECT %s', params, False, {})
+        self.assertEqual(profile.query_count, 3)
+        self.assertEqual(profile.duplicates, 1)
+
+    def test_stats_endpoint(self):
+        """Сводка доступна только сотрудникам."""
+        response = self.client.get('/profiling/')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        admin = User.objects.create_user('admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get('/profiling/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json(), {})
+
+
+class SQLitePragmasTests(TestCase):
+    def pragma(self, db, name):
+        with db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Прагмы из настроек выполняются на соединении."""
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+        self.assertEqual(self.pragma(connection, 'cache_size'), -64000)
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), 5000)
+
+    def test_file_database_uses_wal(self):
+        """База в файле переключается в режим WAL."""
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(
+                connection.settings_dict,
+                NAME=os.path.join(directory, 'wal.sqlite3'),
+            )
+            db = type(connections['default'])(settings_dict, alias='wal')
+            try:
+                self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+            finally:
+                db.close()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=0)
+class ReplicaTests(TransactionTestCase):
+    """Реплика - отдельный файл SQLite, который sync_replica
+    обновляет копией основной базы."""
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        connections.databases['replica'] = dict(
+            connections['default'].settings_dict,
+            NAME=os.path.join(self.directory, 'replica.sqlite3'),
+        )
+        self.user = User.objects.create_user(username='Writer')
+        self.client.force_login(self.user)
+        self.sync_replica()
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(self.directory)
+
+    def sync_replica(self):
+        connections['replica'].close()
+        connections['default'].ensure_connection()
+        target = sqlite3.connect(connections.databases['replica']['NAME'])
+        try:
+            connections['default'].connection.backup(target)
+        finally:
+            target.close()
+
+    def index_posts(self):
+        # Страница из закэшированного фрагмента читалась бы уже после
+        # ответа, вне выбора базы для запроса
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['user'], self.user)
+        return list(response.context['page_obj'])
+
+    def test_reads_from_replica(self):
+        """GET-запросы читают из реплики."""
+        post = Post.objects.create(author=self.user, text='Новый пост')
+        self.assertEqual(self.index_posts(), [])
+        self.sync_replica()
+        self.assertEqual(self.index_posts(), [post])
+
+    def test_read_your_writes(self):
+        """После записи пользователь читает из основной базы."""
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Свой пост'}
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(
+            response.cookies[PIN_COOKIE]['max-age'], 5
+        )
+        self.assertEqual(len(self.index_posts()), 1)
+        # Когда cookie истекла, чтение снова идёт из реплики
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertEqual(self.index_posts(), [])
+
+    @override_settings(REPLICA_MAX_LAG=60)
+    def test_cache_filled_from_primary(self):
+        """Сразу после смены версии кэш заполняется из основной базы:
+        отставшая реплика не кэширует старую ленту под новой версией."""
+        post = Post.objects.create(author=self.user, text='Новый пост')
+        self.assertEqual(self.index_posts(), [post])
+        self.client.logout()
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(list(response.context['page_obj']), [post])
+        # Закэшированный фрагмент отдаётся, не заставляя читать ленту
+        # из основной базы
+        self.client.force_login(self.user)
+        with self.assertNumQueries(0, using='default'):
+            self.client.get(reverse('posts:index'))
+
+    def test_no_pin_without_writes(self):
+        """Запрос без записи не закрепляет пользователя за основной
+        базой."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {'MAX_ENTRIES': 2, 'LOCAL_TIMEOUT': 5},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-tests',
+    },
+})
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+
+    def test_local_tier_serves_hot_keys(self):
+        """Прочитанный ключ отдаётся из памяти процесса, пока не истёк
+        LOCAL_TIMEOUT."""
+        self.shared.set('key', 'shared')
+        self.assertEqual(self.cache.get('key'), 'shared')
+        # Изменение из другого процесса видно не сразу
+        self.shared.set('key', 'changed')
+        self.assertEqual(self.cache.get('key'), 'shared')
+        later = time.monotonic() + 6
+        with mock.patch('core.cache.time.monotonic', return_value=later):
+            self.assertEqual(self.cache.get('key'), 'changed')
+
+    def test_writes_go_through(self):
+        """Запись, инкремент и удаление сразу видны в общем кэше
+        и в памяти процесса."""
+        self.cache.set('key', 1)
+        self.assertEqual(self.shared.get('key'), 1)
+        self.assertEqual(self.cache.incr('key'), 2)
+        self.assertEqual(self.cache.get('key'), 2)
+        self.assertFalse(self.cache.add('key', 10))
+        self.cache.delete('key')
+        self.assertIsNone(self.shared.get('key'))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction(self):
+        """В памяти процесса остаются последние MAX_ENTRIES ключей."""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+        self.shared.clear()
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('c'), 'c')
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'core.cache.TieredCache', 'LOCATION': 'shared',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/cache',
+        },
+    })
+    def test_shared_cache_check(self):
+        """Файловый кэш не годится для общего уровня."""
+        errors = checks.shared_cache(None)
+        self.assertEqual([error.id for error in errors], ['core.E002'])
+
+    def test_values_are_copies(self):
+        """Изменение полученного объекта не меняет закэшированное."""
+        self.cache.set('key', {'items': []})
+        self.cache.get('key')['items'].append(1)
+        self.assertEqual(self.cache.get('key'), {'items': []})
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Bot')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+        self.client.force_login(self.user)
+
+    def test_token_bucket(self):
+        """Ведро отдаёт ёмкость сразу и пополняется со временем."""
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        now = time.time()
+        with mock.patch('core.throttling.time.time', return_value=now):
+            for _ in range(2):
+                self.assertEqual(consume('bucket', 2, 60), 0)
+            self.assertAlmostEqual(consume('bucket', 2, 60), 30)
+        later = now + 30
+        with mock.patch('core.throttling.time.time', return_value=later):
+            self.assertEqual(consume('bucket', 2, 60), 0)
+            self.assertGreater(consume('bucket', 2, 60), 0)
+
+    @override_settings(THROTTLE_RATES={'add_comment': '2/m'})
+    def test_write_view_throttled(self):
+        """Сверх лимита представление отвечает 429 с Retry-After,
+         не записывая данных."""
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        for _ in range(2):
+            response = self.client.post(url, {'text': 'Спам'})
+            self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        response = self.client.post(url, {'text': 'Спам'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.post.comments.count(), 2)
+        # У другого пользователя своё ведро
+        other = User.objects.create_user(username='Human')
+        self.client.force_login(other)
+        response = self.client.post(url, {'text': 'Привет'})
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    @override_settings(
+        THROTTLE_RATES={'add_comment': '2/m'}, THROTTLE_IP_MULTIPLIER=2
+    )
+    def test_accounts_share_ip_bucket(self):
+        """Учётные записи с одного IP делят ведро адреса."""
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        for number in range(4):
+            user = User.objects.create_user(username=f'Bot{number}')
+            self.client.force_login(user)
+            response = self.client.post(url, {'text': 'Спам'})
+            self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        response = self.client.post(
+            url, {'text': 'Спам'}, REMOTE_ADDR='10.0.0.1'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.client.force_login(User.objects.create_user(username='Bot4'))
+        response = self.client.post(url, {'text': 'Спам'})
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_ip(self):
+        """За доверенными прокси IP берётся из X-Forwarded-For,
+         подставленные клиентом значения не учитываются."""
+        cases = (
+            ('1.1.1.1', '', '1.1.1.1'),
+            ('1.1.1.1', '2.2.2.2', '1.1.1.1'),
+            ('10.0.0.1', '2.2.2.2', '2.2.2.2'),
+            ('10.0.0.1', '6.6.6.6, 2.2.2.2, 10.0.0.2', '2.2.2.2'),
+            ('10.0.0.1', 'мусор', 'мусор'),
+            ('10.0.0.1', '', '10.0.0.1'),
+        )
+        factory = RequestFactory()
+        for remote, forwarded, expected in cases:
+            with self.subTest(remote=remote, forwarded=forwarded):
+                request = factory.get(
+                    '/', REMOTE_ADDR=remote, HTTP_X_FORWARDED_FOR=forwarded
+                )
+                self.assertEqual(client_ip(request), expected)
+
+    @override_settings(THROTTLE_RATES={'signup': '1/h'})
+    def test_signup_throttled_by_ip(self):
+        """Регистрация ограничивается по IP, просмотр формы - нет."""
+        self.client.logout()
+        url = reverse('users:signup')
+        self.client.post(url, {})
+        response = self.client.post(url, {})
+        self.assertEqual(response.status_code, 429)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class InlineExecutor(Executor):
+    """Выполняет задачи в потоке теста: данные TestCase видны только
+    его соединению с базой."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+
+class AsgiRequestMixin:
+    def request(self, path, query=b'', headers=(), body=(b'',)):
+        """Выполняет запрос, возвращает сообщения ответа."""
+        messages = [
+            {'type': 'http.request', 'body': chunk, 'more_body': True}
+            for chunk in body
+        ]
+        messages[-1]['more_body'] = False
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path,
+            'query_string': query,
+            'headers': [(b'host', b'testserver'), *headers],
+        }
+        asyncio.run(self.handler(scope, receive, send))
+        return sent
+
+
+class AsgiTests(AsgiRequestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Reader')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+        self.handler = AsgiHandler(threads=1, stream_threads=1)
+        self.handler.executor = InlineExecutor()
+
+    def test_page(self):
+        start, body = self.request(reverse('posts:index'))
+        self.assertEqual(start['status'], HTTPStatus.OK)
+        self.assertIn(
+            (b'content-type', b'text/html; charset=utf-8'), start['headers']
+        )
+        self.assertIn('Пост', body['body'].decode())
+
+    def test_request_body_and_headers(self):
+        """Тело собирается из всех сообщений, заголовки попадают
+        в WSGI-окружение."""
+        messages = [
+            {'type': 'http.request', 'body': b'a=1', 'more_body': True},
+            {'type': 'http.request', 'body': b'&b=2'},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        body = asyncio.run(self.handler.read_body(receive))
+        environ = build_environ({
+            'method': 'POST', 'path': '/поиск/', 'query_string': b'q=1',
+            'headers': [
+                (b'content-length', b'7'),
+                (b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                (b'x-forwarded-for', b'1.1.1.1'),
+            ],
+        }, body)
+        self.assertEqual(environ['wsgi.input'].read(), b'a=1&b=2')
+        self.assertEqual(environ['CONTENT_LENGTH'], '7')
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(environ['HTTP_X_FORWARDED_FOR'], '1.1.1.1')
+        self.assertEqual(
+            environ['PATH_INFO'].encode('latin-1').decode(), '/поиск/'
+        )
+
+    def test_environ_marker(self):
+        """Запросы через ASGI отмечены в окружении: по отметке
+        открываются потоки новых постов."""
+        environ = build_environ({'method': 'GET', 'path': '/'}, None)
+        self.assertIs(environ[asgi.ENVIRON_KEY], True)
+
+    @override_settings(STREAM_MAX_CONNECTIONS=50, ASGI_STREAM_THREADS=50)
+    def test_stream_limits_check(self):
+        """Соединений потоков должно быть меньше потоков для них."""
+        errors = checks.stream_limits(None)
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+    def test_lifespan(self):
+        messages = [
+            {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.handler({'type': 'lifespan'}, receive, send))
+        self.assertEqual(
+            sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+        )
+
+
+class AsgiStreamingTests(AsgiRequestMixin, TransactionTestCase):
+    """Потоковые ответы читаются в отдельном пуле, поэтому данные
+    теста должны быть зафиксированы."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Reader')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+        self.handler = AsgiHandler(threads=1, stream_threads=2)
+
+    def tearDown(self):
+        self.handler.executor.shutdown()
+        self.handler.stream_executor.shutdown()
+
+    def test_streaming_response(self):
+        """Потоковый ответ отправляется кусками, сессия берётся
+        из cookie."""
+        self.client.force_login(self.user)
+        cookie = self.client.cookies['sessionid'].value
+        start, *chunks = self.request(
+            reverse('posts:export'),
+            headers=[(b'cookie', f'sessionid={cookie}'.encode())],
+        )
+        self.assertEqual(start['status'], HTTPStatus.OK)
+        self.assertTrue(chunks[0]['more_body'])
+        self.assertFalse(chunks[-1].get('more_body'))
+        content = b''.join(chunk['body'] for chunk in chunks)
+        self.assertIn('"text": "Пост"', content.decode())
+
+    def test_stream_pinned_to_thread(self):
+        """Ответ читается и закрывается одним потоком пула потоков."""
+        threads = []
+
+        class Content:
+            def __iter__(self):
+                for number in range(3):
+                    threads.append(threading.get_ident())
+                    yield b'x' * asgi.CHUNK_SIZE
+
+            def close(self):
+                threads.append(threading.get_ident())
+
+        def wsgi(environ, start_response):
+            response = StreamingHttpResponse(Content())
+            start_response('200 OK', list(response.items()))
+            return response
+
+        self.handler.wsgi = wsgi
+        start, *chunks = self.request('/')
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(threads), 4)
+        self.assertEqual(len(set(threads)), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_stream_error(self):
+        """Ошибка при чтении потока доходит до сервера, ответ
+        закрывается."""
+        closed = []
+
+        class Content:
+            def __iter__(self):
+                yield b'x'
+                raise ValueError('сбой')
+
+            def close(self):
+                closed.append(True)
+
+        def wsgi(environ, start_response):
+            response = StreamingHttpResponse(Content())
+            start_response('200 OK', list(response.items()))
+            return response
+
+        self.handler.wsgi = wsgi
+        with self.assertRaises(ValueError):
+            self.request('/')
+        self.assertEqual(closed, [True])
+
+
+@override_settings(
+    STREAM_MAX_CONNECTIONS=2, STREAM_MAX_PER_CLIENT=1, STREAM_BUFFER_SIZE=2
+)
+class BrokerTests(TestCase):
+    def setUp(self):
+        self.broker = Broker()
+
+    def test_publish(self):
+        """Сообщение получают только подписчики канала."""
+        first = self.broker.subscribe(['a', 'b'])
+        second = self.broker.subscribe(['b'])
+        self.assertEqual(self.broker.publish('a', 1), 1)
+        self.assertEqual(self.broker.publish('b', 2), 2)
+        self.assertEqual(first.get(0), 1)
+        self.assertEqual(first.get(0), 2)
+        self.assertEqual(second.get(0), 2)
+        self.assertIsNone(second.get(0))
+
+    def test_bounded_buffer(self):
+        """Медленный подписчик теряет старые сообщения, издатель
+        не ждёт."""
+        subscription = self.broker.subscribe(['a'])
+        for message in range(5):
+            self.broker.publish('a', message)
+        self.assertEqual(subscription.dropped, 3)
+        self.assertEqual([subscription.get(0), subscription.get(0)], [3, 4])
+
+    def test_limits(self):
+        first = self.broker.subscribe(['a'], client='user:1')
+        with self.assertRaises(ClientLimitExceeded):
+            self.broker.subscribe(['a'], client='user:1')
+        self.broker.subscribe(['a'], client='user:2')
+        with self.assertRaises(TooManySubscribers):
+            self.broker.subscribe(['a'], client='user:3')
+        first.close()
+        first.close()
+        self.assertEqual(self.broker.subscribers, 1)
+        self.broker.subscribe(['a'], client='user:1')
+        self.assertEqual(self.broker.publish('a', 1), 2)
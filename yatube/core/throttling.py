@@ -0,0 +1,137 @@
+"""Ограничение частоты запросов к изменяющим данные представлениям.
+
+На каждую область (`scope`) выдаётся ведро токенов из настройки
+`THROTTLE_RATES`: '10/m' - ведро на 10 запросов, которое заполняется
+10 токенами в минуту. Пустое ведро - ответ 429 с заголовком
+Retry-After. Анонимный посетитель берёт токены из ведра своего IP,
+пользователь - из своего ведра и из ведра IP для пользователей,
+которое в `THROTTLE_IP_MULTIPLIER` раз больше: за одним адресом бывает
+несколько человек, но множеством учётных записей с одного адреса
+лимит не обойти. IP за доверенными прокси (`TRUSTED_PROXIES`) берётся
+из X-Forwarded-For.
+Состояние ведра хранится в кэше; одновременные запросы из разных
+процессов могут взять по токену сверх лимита, для защиты от ботов
+такой точности достаточно.
+"""
+import ipaddress
+import math
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+BUCKET_KEY = 'throttle:{}:{}'
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60): ёмкость ведра и период его заполнения."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def _tokens(key, capacity, period, now):
+    tokens, updated = cache.get(key, (capacity, now))
+    return min(capacity, tokens + (now - updated) * capacity / period)
+
+
+def consume(key, capacity, period):
+    """Берёт токен из ведра. Возвращает 0 или сколько секунд ждать
+    следующего токена."""
+    return consume_all([(key, capacity)], period)
+
+
+def consume_all(buckets, period):
+    """Берёт по токену из каждого ведра (ключ, ёмкость), если токены
+    есть во всех. Возвращает 0 или сколько секунд ждать."""
+    now = time.time()
+    states = [
+        (key, capacity, _tokens(key, capacity, period, now))
+        for key, capacity in buckets
+    ]
+    wait = max(
+        (1 - tokens) * period / capacity if tokens < 1 else 0
+        for _, capacity, tokens in states
+    )
+    if wait:
+        return wait
+    for key, _, tokens in states:
+        cache.set(key, (tokens - 1, now), period)
+    return 0
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies):
+    return [ipaddress.ip_network(proxy, strict=False) for proxy in proxies]
+
+
+def _trusted(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in network
+        for network in _networks(tuple(settings.TRUSTED_PROXIES))
+    )
+
+
+def client_ip(request):
+    """IP клиента. От доверенного прокси адрес берётся из
+    X-Forwarded-For: справа налево пропускаются доверенные прокси,
+    первый адрес не из них - клиент. Значения левее него мог подставить
+    сам клиент."""
+    address = request.META.get('REMOTE_ADDR', '')
+    if not _trusted(address):
+        return address
+    forwarded = [
+        value.strip()
+        for value in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if value.strip()
+    ]
+    for value in reversed(forwarded):
+        if not _trusted(value):
+            return value
+    return forwarded[0] if forwarded else address
+
+
+def client_id(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def buckets(request, scope, capacity):
+    """Вёдра запроса: (ключ, ёмкость)."""
+    if not request.user.is_authenticated:
+        return [(BUCKET_KEY.format(scope, client_id(request)), capacity)]
+    return [
+        (BUCKET_KEY.format(scope, client_id(request)), capacity),
+        (
+            BUCKET_KEY.format(scope, f'users-ip:{client_ip(request)}'),
+            capacity * settings.THROTTLE_IP_MULTIPLIER,
+        ),
+    ]
+
+
+def throttle(scope, methods=('POST',)):
+    """Ограничивает частоту запросов methods к представлению."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rate = settings.THROTTLE_RATES.get(scope)
+            if rate is None or request.method not in methods:
+                return view(request, *args, **kwargs)
+            capacity, period = parse_rate(rate)
+            wait = consume_all(
+                buckets(request, scope, capacity), period
+            )
+            if wait:
+                response = render(request, 'core/429.html', status=429)
+                response['Retry-After'] = math.ceil(wait)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
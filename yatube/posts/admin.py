@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Comment, Follow
+from .search import get_search_backend
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -13,6 +14,15 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
     list_editable = ('group',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по поисковому индексу вместо LIKE по search_fields."""
+        if not search_term:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        backend = get_search_backend()
+        return backend.search(search_term, queryset), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
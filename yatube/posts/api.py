@@ -0,0 +1,145 @@
+"""JSON API лент и страницы поста, версия 1.
+
+Ленты те же, что в HTML-представлениях, но строки читаются через
+.values() - без создания объектов моделей - и отдаются в компактном
+JSON. Параметр `fields` (через запятую) оставляет в ответе только
+нужные клиенту поля, остальные не читаются из базы. Страницы ленты
+выбираются курсором: в ответе `next` и `previous`, их значение
+передаётся в параметре `cursor`.
+"""
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from .models import Group, Post, User
+from .paginators import (
+    DEFAULT_ORDERING, CursorPaginator, InvalidCursor, MergedCursorPaginator,
+)
+from .timeline import FEED_ORDERING, get_feed
+
+COUNT = 10  # Количество постов на странице
+# Поле ответа -> поле для .values()
+FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_view(view):
+    """Ответы на ошибки в JSON вместо HTML-страниц."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return _response({'error': error.message}, error.status)
+        except Http404:
+            return _response({'error': 'Не найдено'}, 404)
+    return wrapper
+
+
+def _response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def get_fields(request):
+    """Поля ответа из параметра `fields`, по умолчанию все."""
+    value = request.GET.get('fields')
+    if not value:
+        return list(FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def _values(queryset, fields, ordering=DEFAULT_ORDERING):
+    # Поля сортировки читаются всегда: из них собирается курсор
+    lookups = {FIELDS[name] for name in fields}.union(
+        name.lstrip('-') for name in ordering
+    )
+    return queryset.values(*lookups)
+
+
+def serialize(row, fields):
+    data = {name: row[FIELDS[name]] for name in fields}
+    if data.get('image'):
+        data['image'] = default_storage.url(data['image'])
+    elif 'image' in data:
+        data['image'] = None
+    return data
+
+
+def feed_response(request, queryset, ordering=DEFAULT_ORDERING):
+    """Страница ленты; вместо запроса можно передать список
+    источников, как в get_page_obj."""
+    fields = get_fields(request)
+    if isinstance(queryset, list):
+        paginator = MergedCursorPaginator(
+            [_values(source, fields, ordering) for source in queryset],
+            COUNT, ordering,
+        )
+    else:
+        paginator = CursorPaginator(
+            _values(queryset, fields, ordering), COUNT, ordering
+        )
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise ApiError('Неверный курсор')
+    return _response({
+        'results': [serialize(row, fields) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@api_view
+def index(request):
+    return feed_response(request, Post.objects.all())
+
+
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    return feed_response(request, group.posts.all())
+
+
+@api_view
+def profile(request, username):
+    user = get_object_or_404(User.objects.only('pk'), username=username)
+    return feed_response(request, user.posts.all())
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Нужна авторизация', 401)
+    return feed_response(request, get_feed(request.user), FEED_ORDERING)
+
+
+@api_view
+def post_detail(request, post_id):
+    fields = get_fields(request)
+    row = _values(Post.objects.filter(pk=post_id), fields).first()
+    if row is None:
+        raise Http404
+    return _response(serialize(row, fields))
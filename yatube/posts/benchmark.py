@@ -0,0 +1,394 @@
+"""Нагрузочный прогон представлений ленты.
+
+`seed` заполняет базу заданными объёмами данных, `run` замеряет
+задержку и количество запросов к базе для каждого представления,
+`compare` сравнивает отчёт с сохранённым эталоном, `run_concurrent`
+замеряет пропускную способность чтения при параллельной записи,
+`run_slow_clients` сравнивает WSGI и ASGI при медленных клиентах.
+"""
+import asyncio
+import io
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import OperationalError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from faker import Faker
+
+from core.asgi import AsgiHandler, build_environ
+
+from . import counters, timeline, trending
+from .models import Comment, Follow, Group, Post
+from .search import get_search_backend
+
+User = get_user_model()
+
+PERCENTILES = (50, 90, 99)
+SEED_DAYS = 90  # За сколько последних дней распределены посты seed
+
+
+def _bulk(model, objects):
+    # Размер пачки выбирает сам Django: в Django 2.2 явный batch_size
+    # не ограничивается лимитом SQLite на число строк в одном INSERT
+    model.objects.bulk_create(objects)
+
+
+def _redate(model, date_field, dates):
+    """Проставляет последним len(dates) записям модели даты по порядку
+    pk: auto_now_add в bulk_create заменил их текущим временем."""
+    objects = list(
+        model.objects.only('pk').order_by('-pk')[:len(dates)]
+    )[::-1]
+    for obj, date in zip(objects, dates):
+        setattr(obj, date_field, date)
+    model.objects.bulk_update(objects, [date_field])
+
+
+@contextmanager
+def temporary_database():
+    """Временная база в файле: в отличие от базы в памяти, её видят
+    соединения из других потоков, и она ближе к боевой."""
+    with tempfile.TemporaryDirectory() as directory:
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'benchmark.sqlite3'
+        )
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def rebuild_derived():
+    """Перестраивает то, что обычно поддерживают сигналы: в пустой
+    базе это быстрее, чем обрабатывать каждую запись."""
+    counters.rebuild_all()
+    timeline.rebuild()
+    trending.rebuild()
+    get_search_backend().rebuild()
+    # Версии закэшированных лент и страниц не сменились
+    cache.clear()
+
+
+def seed(users, groups, posts, comments, follows, seed_value=0):
+    """Заполняет базу случайными данными.
+
+    Записи создаются через bulk_create в обход сигналов, поэтому
+    счётчики, ленты и поисковый индекс после этого перестраиваются.
+    Посты распределены по последним SEED_DAYS дням в порядке id,
+    комментарии написаны между публикацией поста и текущим моментом.
+    """
+    fake = Faker('ru_RU')
+    fake.seed_instance(seed_value)
+    rnd = random.Random(seed_value)
+    _bulk(User, (
+        User(username=f'user{i}', first_name=fake.first_name(),
+             last_name=fake.last_name())
+        for i in range(users)
+    ))
+    _bulk(Group, (
+        Group(title=fake.sentence(nb_words=3), slug=f'group-{i}',
+              description=fake.text(200))
+        for i in range(groups)
+    ))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    group_ids = list(Group.objects.values_list('pk', flat=True)) + [None]
+    now = timezone.now()
+    span = SEED_DAYS * 24 * 60 * 60
+    post_dates = sorted(
+        now - timedelta(seconds=rnd.uniform(0, span)) for _ in range(posts)
+    )
+    _bulk(Post, (
+        Post(text=fake.text(400), author_id=rnd.choice(user_ids),
+             group_id=rnd.choice(group_ids))
+        for _ in range(posts)
+    ))
+    _redate(Post, 'pub_date', post_dates)
+    post_ids = list(Post.objects.order_by('pk').values_list('pk', flat=True))
+    published = dict(zip(post_ids, post_dates))
+    commented = [rnd.choice(post_ids) for _ in range(comments)]
+    _bulk(Comment, (
+        Comment(text=fake.sentence(), author_id=rnd.choice(user_ids),
+                post_id=post_id)
+        for post_id in commented
+    ))
+    _redate(Comment, 'created', [
+        published[post_id] + (now - published[post_id]) * rnd.random()
+        for post_id in commented
+    ])
+    pairs = set()
+    while len(pairs) < min(follows, len(user_ids) * (len(user_ids) - 1)):
+        user_id, author_id = rnd.sample(user_ids, 2)
+        pairs.add((user_id, author_id))
+    _bulk(Follow, (
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id, author_id in pairs
+    ))
+    rebuild_derived()
+
+
+def scenarios():
+    """Адреса для замера: по одному на представление и глубокая
+    страница главной."""
+    post = Post.objects.order_by('-comments_count').first()
+    author = post.author
+    group = Group.objects.first()
+    reader = User.objects.order_by('-stats__following_count').first()
+    deep_page = max(Post.objects.count() // 10 // 2, 1)
+    urls = {
+        'index': reverse('posts:index'),
+        'index_deep': reverse('posts:index') + f'?page={deep_page}',
+        'profile': reverse('posts:profile', args=[author.username]),
+        'post_detail': reverse('posts:post_detail', args=[post.pk]),
+        'follow_index': reverse('posts:follow_index'),
+    }
+    if group is not None:
+        urls['group_posts'] = reverse('posts:group_list', args=[group.slug])
+    return urls, reader
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = round(percent / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+def measure(client, url, requests, cold=False):
+    """Задержки запросов в миллисекундах и число запросов к базе."""
+    timings = []
+    queries = []
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} вернул {response.status_code}')
+        queries.append(len(context))
+    result = {
+        f'p{percent}': round(_percentile(timings, percent), 3)
+        for percent in PERCENTILES
+    }
+    result['mean'] = round(statistics.mean(timings), 3)
+    result['queries'] = max(queries)
+    return result
+
+
+def run(requests, warmup=1, cold=False):
+    """Замеряет все сценарии. Возвращает словарь результатов."""
+    urls, reader = scenarios()
+    client = Client()
+    client.force_login(reader)
+    results = {}
+    for name, url in urls.items():
+        for _ in range(warmup):
+            client.get(url)
+        results[name] = measure(client, url, requests, cold=cold)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Сценарии, где задержка p90 или число запросов выросли больше
+    допустимого относительно эталона."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p90'] > previous['p90'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p90 {previous["p90"]} -> {current["p90"]} мс'
+            )
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {previous["queries"]} -> '
+                f'{current["queries"]}'
+            )
+    return regressions
+
+
+def _read(urls, reader, deadline, timings):
+    client = Client()
+    client.force_login(reader)
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            client.get(random.choice(urls))
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        connection.close()
+
+
+def _write(author_ids, post_ids, deadline, counts):
+    rnd = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                if rnd.random() < 0.5:
+                    Post.objects.create(
+                        author_id=rnd.choice(author_ids), text='Новый пост'
+                    )
+                else:
+                    Comment.objects.create(
+                        author_id=rnd.choice(author_ids),
+                        post_id=rnd.choice(post_ids),
+                        text='Новый комментарий',
+                    )
+                counts['writes'] += 1
+            except OperationalError:
+                # database is locked: запись не дождалась блокировки
+                counts['errors'] += 1
+    finally:
+        connection.close()
+
+
+def run_concurrent(readers, writers, duration):
+    """Читатели запрашивают страницы, писатели создают посты
+    и комментарии. Возвращает пропускную способность и задержку
+    чтения."""
+    urls, reader = scenarios()
+    urls = list(urls.values())
+    author_ids = list(User.objects.values_list('pk', flat=True))
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    timings = []
+    counts = {'writes': 0, 'errors': 0}
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(
+            target=_read, args=(urls, reader, deadline, timings)
+        )
+        for _ in range(readers)
+    ] + [
+        threading.Thread(
+            target=_write, args=(author_ids, post_ids, deadline, counts)
+        )
+        for _ in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if not timings:
+        raise RuntimeError('Ни одного чтения за время прогона')
+    result = {
+        f'read_p{percent}': round(_percentile(timings, percent), 3)
+        for percent in PERCENTILES
+    }
+    result['reads_per_sec'] = round(len(timings) / duration, 1)
+    result['writes_per_sec'] = round(counts['writes'] / duration, 1)
+    result['write_errors'] = counts['errors']
+    return result
+
+
+def _scope(url):
+    path, _, query = url.partition('?')
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': query.encode(),
+        'headers': [(b'host', b'localhost')],
+    }
+
+
+def _serve_wsgi(handler, url, delay, submitted, timings):
+    """Запрос к WSGI: поток занят, пока клиент читает ответ."""
+    statuses = []
+    response = handler(
+        build_environ(_scope(url), io.BytesIO()),
+        lambda status, headers, exc_info=None: statuses.append(status),
+    )
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    time.sleep(delay)
+    if not statuses[0].startswith('200'):
+        raise RuntimeError(f'{url} вернул {statuses[0]}')
+    timings.append((time.perf_counter() - submitted) * 1000)
+
+
+async def _serve_asgi(handler, url, delay, timings):
+    """Запрос к ASGI: клиент читает ответ в цикле событий."""
+    submitted = time.perf_counter()
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            if message['status'] != 200:
+                raise RuntimeError(f'{url} вернул {message["status"]}')
+        elif not message.get('more_body'):
+            await asyncio.sleep(delay)
+
+    await handler(_scope(url), receive, send)
+    timings.append((time.perf_counter() - submitted) * 1000)
+
+
+def _throughput(timings, elapsed):
+    result = {
+        f'p{percent}': round(_percentile(timings, percent), 3)
+        for percent in PERCENTILES
+    }
+    result['requests_per_sec'] = round(len(timings) / elapsed, 1)
+    return result
+
+
+def run_slow_clients(connections, threads, delay):
+    """Одновременные запросы страниц от медленных клиентов, каждый
+    читает ответ delay секунд. WSGI-сервер моделируется пулом
+    из threads потоков, ASGI-приложение получает пул того же размера.
+    Возвращает задержки от подключения до конца ответа и пропускную
+    способность."""
+    urls, _ = scenarios()
+    # Лента подписок анонимам отвечает перенаправлением
+    urls = [url for name, url in urls.items() if name != 'follow_index']
+    requests = [urls[number % len(urls)] for number in range(connections)]
+    results = {}
+
+    wsgi = WSGIHandler()
+    timings = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [
+            executor.submit(
+                _serve_wsgi, wsgi, url, delay, time.perf_counter(), timings
+            )
+            for url in requests
+        ]
+        for future in futures:
+            future.result()
+    results['wsgi'] = _throughput(timings, time.perf_counter() - started)
+
+    asgi = AsgiHandler(threads)
+    timings = []
+
+    async def serve():
+        await asyncio.gather(*(
+            _serve_asgi(asgi, url, delay, timings) for url in requests
+        ))
+
+    started = time.perf_counter()
+    asyncio.run(serve())
+    results['asgi'] = _throughput(timings, time.perf_counter() - started)
+    asgi.executor.shutdown()
+    return results
@@ -0,0 +1,297 @@
+import contextvars
+import hashlib
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from core.asgi import streams_enabled
+from core.replicas import primary
+
+from .models import Post
+
+FEED_VERSION_KEY = 'posts:feed:version'
+FOLLOW_VERSION_KEY = 'posts:follow:{}:version'
+MODIFIED_KEY = '{}:modified'  # Время последней смены версии
+# Версии данных, которые выводятся на чужих страницах: число постов
+# и имя автора, название группы
+AUTHOR_VERSION_KEY = 'posts:author:{}:version'
+GROUP_VERSION_KEY = 'posts:group:{}:version'
+POST_RELATED_KEY = 'posts:post:{}:related'  # Автор и группа поста
+
+# Версии страниц для анонимных посетителей
+POST_PAGE_VERSION_KEY = 'posts:page:post:{post_id}:version'
+PROFILE_PAGE_VERSION_KEY = 'posts:page:profile:{username}:version'
+GROUP_PAGE_VERSION_KEY = 'posts:page:group:{slug}:version'
+GROUPS_PAGE_VERSION_KEY = 'posts:page:groups:version'
+PAGE_KEY = 'posts:page:{}:{}'
+PAGE_HITS_KEY = 'posts:page:hits'
+PAGE_MISSES_KEY = 'posts:page:misses'
+
+_page_cacheable = contextvars.ContextVar('page_cacheable', default=None)
+
+
+def get_version(key):
+    """Текущая версия закэшированных данных.
+
+    Если версия вытеснена из кэша, начинаем с текущего времени, чтобы
+    новая версия не совпала с одной из прежних.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Делает недействительными все фрагменты с этой версией."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+    cache.set(MODIFIED_KEY.format(key), time.time(), None)
+
+
+def get_modified(key):
+    """Время последней смены версии, как метка времени Unix."""
+    modified = cache.get(MODIFIED_KEY.format(key))
+    if modified is None:
+        cache.add(MODIFIED_KEY.format(key), time.time(), None)
+        modified = cache.get(MODIFIED_KEY.format(key))
+    return modified
+
+
+def fill_from_primary(*keys):
+    """Контекст заполнения кэша с версиями keys.
+
+    Если версия сменилась меньше REPLICA_MAX_LAG секунд назад,
+    реплика может ещё не знать об изменении, и страница, отрисованная
+    по ней, закэшировалась бы под новой версией до следующей смены.
+    Поэтому в этот срок кэш заполняется чтением из основной базы.
+    """
+    # Время смены читается раньше текущего: get_modified может
+    # записать его сам
+    if settings.DATABASE_REPLICAS and any(
+        get_modified(key) > time.time() - settings.REPLICA_MAX_LAG
+        for key in keys
+    ):
+        return primary()
+    return nullcontext()
+
+
+def feed_cache_key(request, user=None):
+    """Ключ фрагмента ленты: версия, страница, есть ли во фрагменте
+    поток новых постов и, для ленты подписок, пользователь с версией
+    его подписок."""
+    parts = [
+        get_version(FEED_VERSION_KEY),
+        request.GET.get('page', ''),
+        request.GET.get('cursor', '-'),
+        int(streams_enabled(request)),
+    ]
+    if user is not None:
+        parts += [user.pk, get_version(FOLLOW_VERSION_KEY.format(user.pk))]
+    return ':'.join(str(part) for part in parts)
+
+
+def feed_cache_context(request, user=None):
+    return {
+        'cache_key': feed_cache_key(request, user),
+        'cache_timeout': settings.POSTS_FEED_CACHE_TIMEOUT,
+        'streams': streams_enabled(request),
+    }
+
+
+def feed_fragment_cached(fragment, request, user=None):
+    """Есть ли в кэше фрагмент ленты fragment для этого запроса."""
+    key = make_template_fragment_key(
+        fragment, [feed_cache_key(request, user)]
+    )
+    return cache.get(key) is not None
+
+
+def feed_fill(cached, user=None):
+    """Контекст отрисовки ленты: если её фрагмента ещё нет в кэше
+    (cached), он заполняется по правилам fill_from_primary."""
+    if cached:
+        return nullcontext()
+    keys = [FEED_VERSION_KEY]
+    if user is not None:
+        keys.append(FOLLOW_VERSION_KEY.format(user.pk))
+    return fill_from_primary(*keys)
+
+
+def post_dependencies(post_id):
+    """Версии автора и группы поста для страницы поста.
+
+    Автор и группа поста запоминаются в кэше, чтобы проверка версий
+    не ходила в базу; сигналы забывают их при изменении поста.
+    """
+    key = POST_RELATED_KEY.format(post_id)
+    related = cache.get(key)
+    if related is None:
+        rows = Post.objects.filter(pk=post_id).values_list(
+            'author_id', 'group_id'
+        ).order_by()
+        if not rows:
+            return []
+        related = rows[0]
+        cache.set(key, related, None)
+    author_id, group_id = related
+    keys = [AUTHOR_VERSION_KEY.format(author_id)]
+    if group_id is not None:
+        keys.append(GROUP_VERSION_KEY.format(group_id))
+    return keys
+
+
+def _page_keys(version_key, dependencies, kwargs):
+    keys = [page_version_key(version_key, **kwargs)]
+    if dependencies is not None:
+        keys += dependencies(**kwargs)
+    return keys
+
+
+def page_condition(version_key, dependencies=None):
+    """Условный GET страницы (ETag и Last-Modified) без запросов к базе.
+
+    Валидаторы строятся из тех же версий страницы, что и ключ
+    anonymous_page_cache, а для пользователя ещё из версии его подписок:
+    изменение одной страницы не сбрасывает валидаторы остальных.
+    Секрет CSRF учитывается только для пользователя - в закэшированной
+    браузером форме комментария должен быть действующий токен;
+    анонимные страницы форм не содержат, и cookie им не выдаётся.
+    """
+    def version_keys(request, kwargs):
+        keys = _page_keys(version_key, dependencies, kwargs)
+        if request.user.is_authenticated:
+            keys.append(FOLLOW_VERSION_KEY.format(request.user.pk))
+        return keys
+
+    def etag(request, *args, **kwargs):
+        parts = [get_version(key) for key in version_keys(request, kwargs)]
+        if request.user.is_authenticated:
+            get_token(request)
+            parts += [request.user.pk, request.META['CSRF_COOKIE']]
+        parts.append(request.get_full_path())
+        return hashlib.md5(
+            ':'.join(str(part) for part in parts).encode()
+        ).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        modified = max(
+            get_modified(key) for key in version_keys(request, kwargs)
+        )
+        return datetime.fromtimestamp(modified, timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def bump_post_pages(post_id, username, slugs=()):
+    """Сбрасывает закэшированные страницы поста, его автора и групп
+    со slug из slugs."""
+    bump_version(page_version_key(POST_PAGE_VERSION_KEY, post_id=post_id))
+    bump_version(page_version_key(PROFILE_PAGE_VERSION_KEY, username=username))
+    for slug in slugs:
+        bump_version(page_version_key(GROUP_PAGE_VERSION_KEY, slug=slug))
+
+
+def page_version_key(key, **kwargs):
+    """Ключ версии страницы. Аргументы хешируются: slug и имена
+    пользователей могут содержать символы, недопустимые в memcached."""
+    return key.format(**{
+        name: hashlib.md5(str(value).encode()).hexdigest()
+        for name, value in kwargs.items()
+    })
+
+
+def skip_page_cache():
+    """Не кэшировать текущую страницу: например, в ней заглушка
+    вместо ещё не созданной миниатюры."""
+    flag = _page_cacheable.get()
+    if flag is not None:
+        flag[0] = False
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def anonymous_page_cache(version_key, dependencies=None):
+    """Кэширует страницу целиком для анонимных посетителей.
+
+    Ключ страницы - путь с параметрами запроса, сервер (под WSGI
+    в страницах нет потоков новых постов) и версия из version_key,
+    в который подставляются аргументы представления, а также версии,
+    которые возвращает dependencies(**kwargs): данные других объектов
+    на странице.
+    Сигналы меняют версию, когда меняется содержимое страницы.
+    Ответы с cookie и страницы, отрисовка которых вызвала
+    skip_page_cache, не кэшируются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = settings.POSTS_PAGE_CACHE_TIMEOUT
+            if (
+                not timeout
+                or request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+            keys = _page_keys(version_key, dependencies, kwargs)
+            version = ':'.join(str(get_version(key)) for key in keys)
+            fill = fill_from_primary(*keys)
+            path = hashlib.md5(
+                f'{request.get_full_path()}:{streams_enabled(request):d}'
+                .encode()
+            ).hexdigest()
+            page_key = PAGE_KEY.format(path, version)
+            response = cache.get(page_key)
+            if response is not None:
+                _count(PAGE_HITS_KEY)
+                response['X-Page-Cache'] = 'hit'
+                return response
+            cacheable = [True]
+            token = _page_cacheable.set(cacheable)
+            try:
+                with fill:
+                    response = view(request, *args, **kwargs)
+            finally:
+                _page_cacheable.reset(token)
+            if (
+                cacheable[0]
+                and response.status_code == 200
+                and not response.cookies
+            ):
+                cache.set(page_key, response, timeout)
+            _count(PAGE_MISSES_KEY)
+            response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
+
+
+def page_cache_stats():
+    hits = cache.get(PAGE_HITS_KEY, 0)
+    misses = cache.get(PAGE_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_page_cache_stats():
+    cache.delete_many([PAGE_HITS_KEY, PAGE_MISSES_KEY])
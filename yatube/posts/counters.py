@@ -0,0 +1,133 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+BATCH_SIZE = 500  # Размер пачки при пересчёте счётчиков
+
+
+def rebuild_user_stats(user_id):
+    """Пересчитывает счётчики одного пользователя по таблицам."""
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=user_id
+            ).count(),
+            'following_count': Follow.objects.filter(
+                user_id=user_id
+            ).count(),
+        },
+    )
+    return stats
+
+
+def get_user_stats(user):
+    """Счётчики пользователя; создаются при первом обращении."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return rebuild_user_stats(user.pk)
+
+
+def increment_user(user_id, field):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + 1}
+    )
+    if not updated:
+        # Запись уже сохранена, поэтому пересчёт её учтёт
+        rebuild_user_stats(user_id)
+
+
+def decrement_user(user_id, field):
+    UserStats.objects.filter(user_id=user_id, **{f'{field}__gt': 0}).update(
+        **{field: F(field) - 1}
+    )
+
+
+def increment_comments(post_id):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + 1
+    )
+
+
+def decrement_comments(post_id):
+    Post.objects.filter(pk=post_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1
+    )
+
+
+def _by_amount(ids):
+    """id с повторами -> {приращение: [id]}: одинаковые приращения
+    делаются одним UPDATE."""
+    groups = defaultdict(list)
+    for pk, amount in Counter(ids).items():
+        groups[amount].append(pk)
+    return groups.items()
+
+
+def increment_users_many(user_ids, field):
+    """Как increment_user для пачки записей; user_ids - id
+    пользователей, по одному на запись."""
+    user_ids = list(user_ids)
+    existing = set(UserStats.objects.filter(
+        user_id__in=set(user_ids)
+    ).values_list('user_id', flat=True))
+    for amount, ids in _by_amount(user_ids):
+        UserStats.objects.filter(user_id__in=ids).update(
+            **{field: F(field) + amount}
+        )
+    for user_id in set(user_ids) - existing:
+        rebuild_user_stats(user_id)
+
+
+def increment_comments_many(post_ids):
+    """Как increment_comments для пачки комментариев."""
+    for amount, ids in _by_amount(post_ids):
+        Post.objects.filter(pk__in=ids).update(
+            comments_count=F('comments_count') + amount
+        )
+
+
+def _count(queryset, field):
+    """Подзапрос с количеством записей queryset для внешнего pk."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+@transaction.atomic
+def rebuild_all():
+    """Пересчитывает все счётчики. Возвращает количество пересчитанных
+    пользователей и постов."""
+    posts = Post.objects.update(
+        comments_count=_count(Comment.objects.all(), 'post')
+    )
+    users = User.objects.annotate(
+        posts_total=_count(Post.objects.all(), 'author'),
+        followers_total=_count(Follow.objects.all(), 'author'),
+        following_total=_count(Follow.objects.all(), 'user'),
+    ).values_list(
+        'pk', 'posts_total', 'followers_total', 'following_total'
+    )
+    UserStats.objects.all().delete()
+    UserStats.objects.bulk_create(
+        (
+            UserStats(
+                user_id=pk,
+                posts_count=posts_count,
+                followers_count=followers_count,
+                following_count=following_count,
+            )
+            for pk, posts_count, followers_count, following_count
+            in users.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return UserStats.objects.count(), posts
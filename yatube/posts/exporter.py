@@ -0,0 +1,73 @@
+"""Выгрузка постов и комментариев пользователя.
+
+Записи читаются из базы пачками через .iterator() и сразу отдаются
+построчно, поэтому память не растёт с количеством записей. Поля
+совпадают с форматом `posts.importer`: выгрузку можно загрузить
+командой import_content.
+"""
+import csv
+import json
+
+from django.core.files.storage import default_storage
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000  # Сколько строк читается из базы за раз
+FIELDS = {
+    'posts': ('id', 'author', 'text', 'group', 'pub_date', 'image'),
+    'comments': ('id', 'post', 'author', 'text', 'created'),
+}
+FORMATS = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _posts(user):
+    posts = Post.objects.filter(author=user).order_by('pk').values_list(
+        'pk', 'text', 'group__slug', 'pub_date', 'image'
+    )
+    for pk, text, group, pub_date, image in posts.iterator(CHUNK_SIZE):
+        yield {
+            'id': pk,
+            'author': user.username,
+            'text': text,
+            'group': group,
+            'pub_date': pub_date.isoformat(),
+            'image': default_storage.url(image) if image else None,
+        }
+
+
+def _comments(user):
+    comments = Comment.objects.filter(author=user).order_by(
+        'pk'
+    ).values_list('pk', 'post_id', 'text', 'created')
+    for pk, post_id, text, created in comments.iterator(CHUNK_SIZE):
+        yield {
+            'id': pk,
+            'post': post_id,
+            'author': user.username,
+            'text': text,
+            'created': created.isoformat(),
+        }
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def export(user, kind, export_format):
+    """Строки выгрузки записей kind ('posts', 'comments') в формате
+    'jsonl' или 'csv'."""
+    rows = _posts(user) if kind == 'posts' else _comments(user)
+    if export_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+        return
+    fields = FIELDS[kind]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(
+            ['' if row[field] is None else row[field] for field in fields]
+        )
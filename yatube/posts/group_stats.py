@@ -0,0 +1,89 @@
+"""Сводка по группам для каталога.
+
+Количество постов, последняя активность и самые активные авторы
+считаются для всех групп сразу несколькими запросами с группировкой
+и записываются в таблицу GroupStats. Каталог читает готовую таблицу,
+поэтому его страница не зависит от числа постов. Пересчёт запускается
+периодически командой aggregate_groups; между запусками сводка может
+отставать, новые группы появляются в каталоге сразу с нулями.
+"""
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .caching import GROUPS_PAGE_VERSION_KEY, bump_version
+from .models import Comment, Group, GroupStats, Post, User
+
+BATCH_SIZE = 500  # Размер пачки при записи сводки
+TOP_AUTHORS = 3  # Сколько авторов показывать у группы
+
+
+def _top_authors():
+    """Самые активные авторы групп: группа -> [(id автора, постов)]."""
+    rows = Post.objects.filter(group__isnull=False).values(
+        'group', 'author'
+    ).annotate(count=Count('pk')).order_by('group', '-count', 'author')
+    top = defaultdict(list)
+    for row in rows.iterator():
+        authors = top[row['group']]
+        if len(authors) < TOP_AUTHORS:
+            authors.append((row['author'], row['count']))
+    return top
+
+
+def aggregate():
+    """Пересчитывает сводку по всем группам. Возвращает число групп."""
+    now = timezone.now()
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+    posts = {
+        row['group']: row
+        for row in Post.objects.filter(group__isnull=False).values(
+            'group'
+        ).annotate(count=Count('pk'), last=Max('pub_date')).order_by()
+    }
+    comments = dict(
+        Comment.objects.filter(post__group__isnull=False).values(
+            'post__group'
+        ).annotate(last=Max('created')).order_by().values_list(
+            'post__group', 'last'
+        )
+    )
+    top = _top_authors()
+    users = User.objects.only(
+        'username', 'first_name', 'last_name'
+    ).in_bulk({author for authors in top.values() for author, _ in authors})
+    stats = []
+    for pk in group_ids:
+        row = posts.get(pk, {})
+        dates = [
+            date for date in (row.get('last'), comments.get(pk)) if date
+        ]
+        stats.append(GroupStats(
+            group_id=pk,
+            posts_count=row.get('count', 0),
+            last_activity=max(dates, default=None),
+            top_authors=json.dumps([
+                {
+                    'username': users[author].username,
+                    'name': users[author].get_full_name(),
+                    'posts': count,
+                }
+                for author, count in top.get(pk, ())
+            ], ensure_ascii=False),
+            updated=now,
+        ))
+    with transaction.atomic():
+        GroupStats.objects.all().delete()
+        GroupStats.objects.bulk_create(stats, batch_size=BATCH_SIZE)
+    bump_version(GROUPS_PAGE_VERSION_KEY)
+    return len(stats)
+
+
+def get_directory():
+    """Сводки групп для каталога: сначала самые большие."""
+    return GroupStats.objects.select_related('group').order_by(
+        '-posts_count', '-group'
+    )
@@ -0,0 +1,335 @@
+"""Массовый импорт пользователей, групп, постов, комментариев и подписок.
+
+Файлы читаются построчно (JSON Lines или CSV с заголовком) и
+записываются через bulk_create пачками. Связи задаются естественными
+ключами: пользователь - username, группа - slug, пост - поле `id`
+из исходных данных. Соответствие ключей и id хранится в словарях
+в памяти, поэтому записи можно ссылаться на импортированные раньше.
+
+bulk_create не вызывает сигналы, поэтому после каждой пачки импортёр
+сам обновляет то, что при обычном сохранении обновляют обработчики
+post_save: счётчики, ленты подписок, рейтинг популярного, поисковый
+индекс и версии кэша. Обновления делаются сразу для всей пачки
+(одним UPDATE на приращение, одним bulk_create, одной сменой версии)
+и только для импортированных записей.
+"""
+import csv
+import json
+import os
+from itertools import islice
+from operator import attrgetter
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, streams, timeline, trending
+from .caching import (
+    AUTHOR_VERSION_KEY, FEED_VERSION_KEY, FOLLOW_VERSION_KEY,
+    GROUP_PAGE_VERSION_KEY, GROUPS_PAGE_VERSION_KEY, PROFILE_PAGE_VERSION_KEY,
+    bump_post_pages, bump_version, page_version_key,
+)
+from .models import Comment, Follow, Group, GroupStats, Post, UserStats
+from .search import get_search_backend
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+# Порядок импорта: записи ссылаются на импортированные раньше
+KINDS = ('users', 'groups', 'posts', 'comments', 'follows')
+
+
+class ImportDataError(Exception):
+    pass
+
+
+def read_records(path):
+    """Записи файла с номерами строк. Формат - по расширению:
+    .csv или .jsonl."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as file:
+        if extension == '.csv':
+            # Первая строка - заголовок
+            for line, record in enumerate(csv.DictReader(file), 2):
+                yield line, {
+                    key: value for key, value in record.items() if value
+                }
+        elif extension in ('.jsonl', '.json'):
+            for line, text in enumerate(file, 1):
+                if text.strip():
+                    try:
+                        yield line, json.loads(text)
+                    except ValueError as error:
+                        raise ImportDataError(f'{path}:{line}: {error}')
+        else:
+            raise ImportDataError(f'{path}: неизвестный формат файла')
+
+
+def kind_from_path(path):
+    """Тип записей по имени файла: posts.jsonl, users.csv и т. п."""
+    kind = os.path.splitext(os.path.basename(path))[0].lower()
+    if kind not in KINDS:
+        raise ImportDataError(
+            f'{path}: имя файла должно быть одним из {", ".join(KINDS)}'
+        )
+    return kind
+
+
+def _parse_date(value):
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'неверная дата {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def _distinct(objects, field):
+    """Значения поля у записей пачки без повторов и None."""
+    return set(map(attrgetter(field), objects)) - {None}
+
+
+class Importer:
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.usernames = {pk: name for name, pk in self.users.items()}
+        self.slugs = {pk: slug for slug, pk in self.groups.items()}
+        self.posts = {}  # id из исходных данных -> id поста
+        self._next_ids = {}
+
+    def import_file(self, kind, path):
+        """Импортирует файл. Возвращает количество прочитанных записей."""
+        handler = getattr(self, f'_create_{kind}')
+        records = read_records(path)
+        total = 0
+        batch = list(islice(records, self.batch_size))
+        while batch:
+            try:
+                handler([record for _, record in batch])
+            except (KeyError, ValueError) as error:
+                raise ImportDataError(
+                    f'{path}:{batch[0][0]}-{batch[-1][0]}: {error!r}'
+                )
+            total += len(batch)
+            batch = list(islice(records, self.batch_size))
+        return total
+
+    def reset_sequences(self):
+        """После явно заданных id счётчики первичных ключей нужно
+        сдвинуть (в PostgreSQL, SQLite делает это сама)."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _allocate_ids(self, model, count):
+        """id для записей пачки, на которые ссылаются следующие записи.
+
+        Если база возвращает id из bulk_create (PostgreSQL), их выдаёт
+        её последовательность, и заранее ничего не выделяется (None).
+        Иначе берутся id после последнего: строка с ним читается
+        с блокировкой, которая в MySQL до конца транзакции импорта не
+        даёт вставить записи после неё; SQLite и так пропускает
+        только одну пишущую транзакцию.
+        """
+        if connection.features.can_return_ids_from_bulk_insert:
+            return [None] * count
+        if model not in self._next_ids:
+            last = model.objects.select_for_update().order_by(
+                '-pk'
+            ).values_list('pk', flat=True).first() or 0
+            self._next_ids[model] = last + 1
+        start = self._next_ids[model]
+        self._next_ids[model] = start + count
+        return range(start, start + count)
+
+    def _bump_profiles(self, user_ids):
+        for user_id in user_ids:
+            bump_version(page_version_key(
+                PROFILE_PAGE_VERSION_KEY, username=self.usernames[user_id]
+            ))
+
+    def _bump_groups(self, group_ids):
+        for group_id in group_ids:
+            bump_version(page_version_key(
+                GROUP_PAGE_VERSION_KEY, slug=self.slugs[group_id]
+            ))
+
+    def _user(self, username):
+        try:
+            return self.users[username]
+        except KeyError:
+            raise ValueError(f'неизвестный пользователь {username!r}')
+
+    def _create_users(self, records):
+        usernames = [
+            record['username'] for record in records
+            if record['username'] not in self.users
+        ]
+        User.objects.bulk_create(
+            (
+                User(
+                    username=record['username'],
+                    first_name=record.get('first_name', ''),
+                    last_name=record.get('last_name', ''),
+                    email=record.get('email', ''),
+                    password='!',  # Без пароля: вход только после сброса
+                )
+                for record in records
+            ),
+            ignore_conflicts=True,
+        )
+        created = list(User.objects.filter(
+            username__in=usernames
+        ).values_list('username', 'pk'))
+        for username, pk in created:
+            self.users[username] = pk
+            self.usernames[pk] = username
+        # У новых пользователей нет постов и закэшированных страниц,
+        # а счётчики нулевые: записи создаются сразу, чтобы следующие
+        # пачки увеличивали их, а не пересчитывали
+        UserStats.objects.bulk_create(
+            (UserStats(user_id=pk) for _, pk in created),
+            ignore_conflicts=True,
+        )
+
+    def _create_groups(self, records):
+        slugs = [
+            record['slug'] for record in records
+            if record['slug'] not in self.groups
+        ]
+        Group.objects.bulk_create(
+            (
+                Group(
+                    slug=record['slug'],
+                    title=record.get('title', record['slug']),
+                    description=record.get('description', ''),
+                )
+                for record in records
+            ),
+            ignore_conflicts=True,
+        )
+        created = list(Group.objects.filter(slug__in=slugs).values_list(
+            'slug', 'pk'
+        ))
+        for slug, pk in created:
+            self.groups[slug] = pk
+            self.slugs[pk] = slug
+        # Группа попадает в каталог сразу, сводку заполнит пересчёт
+        GroupStats.objects.bulk_create(
+            (GroupStats(group_id=pk) for _, pk in created),
+            ignore_conflicts=True,
+        )
+        bump_version(GROUPS_PAGE_VERSION_KEY)
+        bump_version(FEED_VERSION_KEY)
+
+    def _create_posts(self, records):
+        posts = []
+        for pk, record in zip(
+            self._allocate_ids(Post, len(records)), records
+        ):
+            group = record.get('group')
+            if group is not None and group not in self.groups:
+                raise ValueError(f'неизвестная группа {group!r}')
+            post = Post(
+                pk=pk,
+                text=record['text'],
+                author_id=self._user(record['author']),
+                group_id=self.groups.get(group),
+            )
+            if 'pub_date' in record:
+                post.pub_date = _parse_date(record['pub_date'])
+            posts.append(post)
+        self._bulk_create_dated(Post, posts, 'pub_date')
+        for post, record in zip(posts, records):
+            if 'id' in record:
+                self.posts[str(record['id'])] = post.pk
+        authors = _distinct(posts, 'author_id')
+        counters.increment_users_many(
+            (post.author_id for post in posts), 'posts_count'
+        )
+        timeline.fan_out_many(posts)
+        trending.score_posts(posts)
+        for post in posts:
+            streams.publish_post(post)
+        get_search_backend().index_many(posts)
+        bump_version(FEED_VERSION_KEY)
+        for author_id in authors:
+            bump_version(AUTHOR_VERSION_KEY.format(author_id))
+        self._bump_profiles(authors)
+        self._bump_groups(_distinct(posts, 'group_id'))
+
+    def _create_comments(self, records):
+        comments = []
+        for pk, record in zip(
+            self._allocate_ids(Comment, len(records)), records
+        ):
+            post = str(record['post'])
+            if post not in self.posts:
+                raise ValueError(f'неизвестный пост {post!r}')
+            comment = Comment(
+                pk=pk,
+                text=record['text'],
+                author_id=self._user(record['author']),
+                post_id=self.posts[post],
+            )
+            if 'created' in record:
+                comment.created = _parse_date(record['created'])
+            comments.append(comment)
+        self._bulk_create_dated(Comment, comments, 'created')
+        counters.increment_comments_many(
+            comment.post_id for comment in comments
+        )
+        trending.score_comments(comments)
+        bump_version(FEED_VERSION_KEY)
+        related = Post.objects.filter(
+            pk__in=_distinct(comments, 'post_id')
+        ).values_list('pk', 'author__username', 'group__slug')
+        for pk, username, slug in related:
+            bump_post_pages(pk, username, [slug] if slug else ())
+
+    def _bulk_create_dated(self, model, objects, date_field):
+        """bulk_create, после которого даты из исходных данных
+        возвращаются на место: auto_now_add их перезаписывает."""
+        dates = [getattr(obj, date_field) for obj in objects]
+        model.objects.bulk_create(objects)
+        dated = []
+        for obj, date in zip(objects, dates):
+            if date is not None:
+                setattr(obj, date_field, date)
+                dated.append(obj)
+        if dated:
+            model.objects.bulk_update(dated, [date_field])
+
+    def _create_follows(self, records):
+        pairs = set()
+        for record in records:
+            user = self._user(record['user'])
+            author = self._user(record['author'])
+            if user != author:
+                pairs.add((user, author))
+        existing = Follow.objects.filter(
+            user_id__in={user for user, _ in pairs}
+        ).values_list('user_id', 'author_id')
+        pairs.difference_update(existing)
+        follows = [
+            Follow(user_id=user, author_id=author) for user, author in pairs
+        ]
+        Follow.objects.bulk_create(follows)
+        counters.increment_users_many(
+            (follow.user_id for follow in follows), 'following_count'
+        )
+        counters.increment_users_many(
+            (follow.author_id for follow in follows), 'followers_count'
+        )
+        trending.score_follows(follows)
+        timeline.backfill_many(follows)
+        for user_id in _distinct(follows, 'user_id'):
+            bump_version(FOLLOW_VERSION_KEY.format(user_id))
+        self._bump_profiles(_distinct(follows, 'author_id'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.group_stats import aggregate
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сводку по группам для каталога: количество '
+            'постов, последнюю активность и активных авторов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float, default=None,
+            help='Повторять пересчёт каждые N секунд'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            total = aggregate()
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитана сводка {total} групп за '
+                f'{time.perf_counter() - started:.2f} с'
+            ))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
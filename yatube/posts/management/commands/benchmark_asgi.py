@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность WSGI и ASGI, когда '
+            'клиенты медленно читают ответы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument(
+            '--connections', type=int, default=500,
+            help='Сколько клиентов подключаются одновременно'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Потоков у WSGI-сервера и в пуле ASGI-приложения'
+        )
+        parser.add_argument(
+            '--delay', type=float, default=0.2,
+            help='Сколько секунд клиент читает ответ'
+        )
+
+    def handle(self, *args, **options):
+        with benchmark.temporary_database():
+            benchmark.seed(
+                users=options['users'], groups=10,
+                posts=options['posts'], comments=options['posts'],
+                follows=options['users'] * 5,
+            )
+            results = benchmark.run_slow_clients(
+                options['connections'], options['threads'], options['delay']
+            )
+        columns = ['requests_per_sec'] + [
+            f'p{percent}' for percent in benchmark.PERCENTILES
+        ]
+        self.stdout.write(
+            f'{"server":<8}' + ''.join(f'{name:>18}' for name in columns)
+        )
+        for server, result in results.items():
+            self.stdout.write(f'{server:<8}' + ''.join(
+                f'{result[name]:>18}' for name in columns
+            ))
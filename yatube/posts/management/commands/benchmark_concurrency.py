@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет пропускную способность чтения страниц, пока '
+            'параллельно создаются посты и комментарии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=1)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность прогона в секундах'
+        )
+        parser.add_argument(
+            '--no-pragmas', action='store_true',
+            help='Прогон без SQLITE_PRAGMAS для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        pragmas = override_settings(SQLITE_PRAGMAS={})
+        if options['no_pragmas']:
+            pragmas.enable()
+        try:
+            with benchmark.temporary_database():
+                benchmark.seed(
+                    users=options['users'], groups=10,
+                    posts=options['posts'], comments=options['posts'],
+                    follows=options['users'] * 5,
+                )
+                result = benchmark.run_concurrent(
+                    options['readers'], options['writers'],
+                    options['duration'],
+                )
+        finally:
+            if options['no_pragmas']:
+                pragmas.disable()
+        for name, value in result.items():
+            self.stdout.write(f'{name:<16}{value:>12}')
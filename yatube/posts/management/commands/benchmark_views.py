@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Заполняет временную базу данными заданного объёма и замеряет '
+            'задержку и количество запросов представлений ленты')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=1000)
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Количество замеряемых запросов на представление'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--output', help='Файл, в который сохранить отчёт в JSON'
+        )
+        parser.add_argument(
+            '--baseline', help='Отчёт в JSON, с которым сравнить результат'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p90 относительно эталона, доля'
+        )
+
+    def handle(self, *args, **options):
+        if options['posts'] < 1 or options['users'] < 2:
+            raise CommandError('Нужны хотя бы один пост и два пользователя')
+        volumes = {
+            key: options[key]
+            for key in ('users', 'groups', 'posts', 'comments', 'follows')
+        }
+        with benchmark.temporary_database():
+            benchmark.seed(**volumes)
+            results = benchmark.run(options['requests'], cold=options['cold'])
+        report = {'volumes': volumes, 'results': results}
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            regressions = benchmark.compare(
+                results, baseline['results'], options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n' + '\n'.join(regressions)
+                )
+
+    def print_report(self, results):
+        columns = ('p50', 'p90', 'p99', 'mean', 'queries')
+        self.stdout.write(
+            f'{"представление":<16}' + ''.join(f'{c:>10}' for c in columns)
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<16}'
+                + ''.join(f'{result[c]:>10}' for c in columns)
+            )
@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from django.core.management.base import BaseCommand
+
+from posts import renditions
+from posts.models import Post
+from posts.thumbnails import images_changed, init_worker
+
+BATCH_SIZE = 1000  # Сколько картинок отдаётся пулу за раз
+
+
+def build(name, force):
+    try:
+        return renditions.create(name, force=force), None
+    except (OSError, ValueError) as error:
+        return False, f'{name}: {error}'
+
+
+class Command(BaseCommand):
+    help = ('Создаёт адаптивные копии картинок постов '
+            'в нескольких процессах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов, 0 — в текущем процессе'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать уже существующие копии'
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct().iterator()
+        force = options['force']
+        created = skipped = 0
+        executor = None
+        if options['workers']:
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+        try:
+            batch = list(islice(names, BATCH_SIZE))
+            while batch:
+                if executor is not None:
+                    results = executor.map(
+                        build, batch, repeat(force), chunksize=16
+                    )
+                else:
+                    results = map(build, batch, repeat(force))
+                changed = []
+                for name, (done, error) in zip(batch, results):
+                    if error:
+                        self.stderr.write(error)
+                    if done:
+                        changed.append(name)
+                    else:
+                        skipped += 1
+                if changed:
+                    # В закэшированных страницах карточки без копий
+                    images_changed(changed)
+                created += len(changed)
+                batch = list(islice(names, BATCH_SIZE))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано копий: {created}, пропущено: {skipped}'
+        ))
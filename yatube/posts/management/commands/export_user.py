@@ -0,0 +1,39 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.exporter import FIELDS, FORMATS, export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты или комментарии пользователя в JSON Lines или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--kind', choices=FIELDS, default='posts')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument(
+            '--output', help='Файл для выгрузки, по умолчанию stdout'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден'
+            )
+        lines = export(user, options['kind'], options['format'])
+        if options['output'] is None:
+            self.write(sys.stdout, lines)
+            return
+        with open(options['output'], 'w', newline='',
+                  encoding='utf-8') as file:
+            self.write(file, lines)
+
+    def write(self, file, lines):
+        for line in lines:
+            file.write(line)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.importer import (
+    BATCH_SIZE, KINDS, Importer, ImportDataError, kind_from_path,
+)
+
+
+class Command(BaseCommand):
+    help = ('Импортирует пользователей, группы, посты, комментарии '
+            'и подписки из файлов JSON Lines или CSV')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='Файлы users, groups, posts, comments, follows '
+                 'с расширением .jsonl или .csv'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько записей вставляется одним запросом'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            files = sorted(
+                ((kind_from_path(path), path) for path in options['paths']),
+                key=lambda item: KINDS.index(item[0]),
+            )
+            started = time.perf_counter()
+            total = 0
+            with transaction.atomic():
+                importer = Importer(options['batch_size'])
+                for kind, path in files:
+                    file_started = time.perf_counter()
+                    count = importer.import_file(kind, path)
+                    total += count
+                    self.report(kind, count, file_started)
+                importer.reset_sequences()
+        except (ImportDataError, OSError) as error:
+            raise CommandError(error)
+        self.report('всего', total, started)
+
+    def report(self, name, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: {count} записей за {elapsed:.2f} с '
+            f'({rate:.0f} записей/с)'
+        ))
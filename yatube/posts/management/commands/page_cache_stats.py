@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import page_cache_stats, reset_page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Выводит попадания и промахи кэша страниц для анонимных посетителей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики'
+        )
+
+    def handle(self, *args, **options):
+        stats = page_cache_stats()
+        ratio = stats['hit_ratio']
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {"-" if ratio is None else f"{ratio:.1%}"}'
+        )
+        if options['reset']:
+            reset_page_cache_stats()
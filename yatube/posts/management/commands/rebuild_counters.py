@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild_all
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, комментариев '
+            'и подписок по данным в базе')
+
+    def handle(self, *args, **options):
+        users, posts = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счётчики {users} пользователей и {posts} постов'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Убирает из рейтинга популярного старые посты, с --full '
+            'пересчитывает рейтинг по базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать рейтинг всех постов окна заново'
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            total = trending.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитан рейтинг постов: {total}'
+            ))
+            return
+        removed = trending.prune()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено устаревших постов из рейтинга: {removed}'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = ('Возобновляет раскладку постов авторов, которые перестали '
+            'быть популярными, и добавляет их последние посты в ленты '
+            'подписчиков')
+
+    def handle(self, *args, **options):
+        resumed = timeline.resume_fanout()
+        self.stdout.write(self.style.SUCCESS(
+            f'Возобновлена раскладка постов авторов: {resumed}'
+        ))
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from posts.stemmer import stem_text
+
+
+def create_search_index(apps, schema_editor):
+    """Создаёт индекс FTS5 и заполняет его основами слов постов."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts '
+        "USING fts5(body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    for pk, text in Post.objects.values_list('pk', 'text').iterator():
+        schema_editor.execute(
+            'INSERT INTO posts_post_fts (rowid, body) VALUES (%s, %s)',
+            [pk, stem_text(text)],
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
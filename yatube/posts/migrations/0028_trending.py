@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from posts.trending import add, contribution, cutoff
+
+
+def fill_trending(apps, schema_editor):
+    """Считает рейтинг постов, которые уже есть в окне."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    TrendingScore = apps.get_model('posts', 'TrendingScore')
+    since = cutoff()
+    scores = {
+        pk: contribution(
+            1 + settings.POSTS_TRENDING_FOLLOWER_WEIGHT * (followers or 0),
+            pub_date,
+        )
+        for pk, pub_date, followers in Post.objects.filter(
+            pub_date__gte=since
+        ).values_list('pk', 'pub_date', 'author__stats__followers_count')
+    }
+    comments = Comment.objects.filter(
+        post__pub_date__gte=since
+    ).values_list('post_id', 'created')
+    for post_id, created in comments:
+        scores[post_id] = add(
+            scores[post_id],
+            contribution(settings.POSTS_TRENDING_COMMENT_WEIGHT, created),
+        )
+    TrendingScore.objects.bulk_create(
+        (
+            TrendingScore(post_id=pk, score=score)
+            for pk, score in scores.items()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('score', models.FloatField(help_text='Двоичный логарифм суммы вкладов событий', verbose_name='Рейтинг')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['score', 'post'], name='trending_score_idx'),
+        ),
+        migrations.RunPython(fill_trending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def fill_group_stats(apps, schema_editor):
+    """Сводка по уже существующим группам без авторов: их посчитает
+    первый запуск aggregate_groups."""
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    groups = Group.objects.annotate(
+        count=Count('posts'), last=Max('posts__pub_date')
+    )
+    GroupStats.objects.bulk_create(
+        (
+            GroupStats(
+                group_id=group.pk,
+                posts_count=group.count,
+                last_activity=group.last,
+            )
+            for group in groups.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0028_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+                ('last_activity', models.DateTimeField(blank=True, help_text='Дата последнего поста или комментария в группе', null=True, verbose_name='Последняя активность')),
+                ('top_authors', models.TextField(default='[]', help_text='JSON-список: username, имя и количество постов', verbose_name='Самые активные авторы')),
+                ('updated', models.DateTimeField(blank=True, null=True, verbose_name='Время пересчёта')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['posts_count', 'group'], name='group_stats_posts_idx'),
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
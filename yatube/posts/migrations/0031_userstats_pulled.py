@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0030_timeline_feed_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='pulled',
+            field=models.BooleanField(default=False, help_text='Автор стал популярным; раскладку возобновит команда resume_fanout', verbose_name='Посты не раскладываются по лентам'),
+        ),
+    ]
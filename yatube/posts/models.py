@@ -1,9 +1,45 @@
-from django.db import models
+import json
+
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class AtomicSaveModel(models.Model):
+    """Сохранение записи и обработчики post_save (счётчики, ленты)
+    выполняются в одной транзакции.
+
+    Поля из counter_fields меняются только запросами UPDATE со
+    значением F(): при изменении записи save() их не перезаписывает,
+    иначе значение, прочитанное до чужого изменения счётчика,
+    откатило бы его.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            self.counter_fields
+            and not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields
+            ]
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
 class Group(models.Model):
     title = models.CharField(
         max_length=200,
@@ -24,7 +60,18 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа выбираются тем же запросом,
+        загружаются только поля, которые выводит карточка поста."""
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'image',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__slug', 'group__title',
+        )
+
+
+class Post(AtomicSaveModel):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -55,15 +102,44 @@ class Post(models.Model):
         blank=True,
         help_text='Выберите картинку'
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+        help_text='Обновляется автоматически при добавлении '
+        'и удалении комментариев'
+    )
+
+    objects = PostQuerySet.as_manager()
+    counter_fields = ('comments_count',)
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ['-pub_date']
+        # Столбцы по возрастанию: SQLite читает индекс с конца, и он
+        # подходит и для сортировки по -pub_date, и для курсорной
+        # по (-pub_date, -id)
+        indexes = [
+            models.Index(
+                fields=['author', 'pub_date'], name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_date_idx'
+            ),
+        ]
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_thread(self):
+        """Комментарии под постом вместе с авторами одним запросом."""
+        return self.select_related('author').only(
+            'text', 'created', 'post_id', 'author__username',
+        )
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -89,14 +165,21 @@ class Comment(models.Model):
         db_index=True,
     )
 
+    objects = CommentQuerySet.as_manager()
+
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'
+            ),
+        ]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveModel):
     user = models.ForeignKey(
         User,
         related_name='follower',
@@ -119,3 +202,150 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique follow'
             )
         ]
+        # Подписчики автора: уникальное ограничение начинается с user
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок.
+
+    Создаётся для каждого подписчика при публикации поста, чтобы
+    лента подписок читалась без соединения с таблицей подписок.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        verbose_name='Владелец ленты',
+        help_text='Подписчик, в ленту которого попал пост.'
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        help_text='Пост автора, на которого подписан пользователь.'
+    )
+    pub_date = models.DateTimeField(
+        'Дата публикации поста',
+        help_text='Копия даты публикации поста для сортировки ленты'
+    )
+
+    class Meta:
+        ordering = ['-pub_date']
+        # Лента выбирается по ключу (pub_date, post): индекс с постом
+        # в конце читается с конца без сортировки и для курсора
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_date_post_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique timeline entry'
+            )
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые обновляются при изменении
+    постов и подписок, чтобы не считать их при каждом запросе."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов', default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок', default=0
+    )
+    pulled = models.BooleanField(
+        'Посты не раскладываются по лентам', default=False,
+        help_text='Автор стал популярным; раскладку возобновит команда '
+        'resume_fanout'
+    )
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TrendingScore(models.Model):
+    """Рейтинг поста в ленте популярного, обновляется при появлении
+    комментариев и подписчиков автора (`posts.trending`)."""
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        related_name='trending',
+        on_delete=models.CASCADE,
+        verbose_name='Пост'
+    )
+    score = models.FloatField(
+        'Рейтинг',
+        help_text='Двоичный логарифм суммы вкладов событий'
+    )
+
+    class Meta:
+        # Лента популярного читает индекс с конца: первые посты
+        # выбираются без сортировки всей таблицы
+        indexes = [
+            models.Index(
+                fields=['score', 'post'], name='trending_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.3f}'
+
+
+class GroupStats(models.Model):
+    """Сводка по группе для каталога групп. Пересчитывается
+    периодически (`posts.group_stats`), а не при каждом запросе."""
+    group = models.OneToOneField(
+        Group,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE,
+        verbose_name='Группа'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов', default=0
+    )
+    last_activity = models.DateTimeField(
+        'Последняя активность',
+        null=True, blank=True,
+        help_text='Дата последнего поста или комментария в группе'
+    )
+    top_authors = models.TextField(
+        'Самые активные авторы',
+        default='[]',
+        help_text='JSON-список: username, имя и количество постов'
+    )
+    updated = models.DateTimeField(
+        'Время пересчёта', null=True, blank=True
+    )
+
+    class Meta:
+        # Каталог читает индекс с конца в порядке (-posts_count, -group)
+        indexes = [
+            models.Index(
+                fields=['posts_count', 'group'], name='group_stats_posts_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.group_id)
+
+    def get_top_authors(self):
+        return json.loads(self.top_authors)
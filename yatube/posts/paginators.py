@@ -0,0 +1,210 @@
+import base64
+import binascii
+import json
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+NEXT = 'n'  # Курсор указывает на записи после объекта
+PREVIOUS = 'p'  # Курсор указывает на записи до объекта
+DEFAULT_ORDERING = ('-pub_date', '-pk')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(Page):
+    """Страница курсорной пагинации.
+
+    Номера страницы и общего количества записей нет: вместо них
+    страница знает курсоры соседних страниц.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.is_cursor = True
+
+    def __repr__(self):
+        return '<CursorPage of %s>' % len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], PREVIOUS)
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу сортировки (keyset).
+
+    Вместо OFFSET и COUNT(*) страница выбирается условием
+    `(pub_date, id) < (курсор)`, поэтому любая страница стоит
+    столько же, сколько первая. Сортировать можно и по аннотациям
+    запроса, например по ключу записей ленты подписок.
+    """
+
+    def __init__(self, object_list, per_page, ordering=DEFAULT_ORDERING):
+        self.ordering = tuple(ordering)
+        super().__init__(object_list.order_by(*self.ordering), per_page)
+
+    def _fields(self):
+        opts = self.object_list.model._meta
+        annotations = self.object_list.query.annotations
+        for name in self.ordering:
+            attname = name.lstrip('-')
+            if attname in annotations:
+                field = annotations[attname].output_field
+            elif attname == 'pk':
+                field = opts.pk
+            else:
+                field = opts.get_field(attname)
+            yield attname, field, name.startswith('-')
+
+    def _key(self, obj):
+        """Значения полей сортировки объекта или строки .values()."""
+        if isinstance(obj, dict):
+            return tuple(obj[attname] for attname, _, _ in self._fields())
+        return tuple(
+            getattr(obj, attname) for attname, _, _ in self._fields()
+        )
+
+    def encode_cursor(self, obj, direction):
+        values = [
+            field.value_to_string(SimpleNamespace(**{field.attname: value}))
+            for (_, field, _), value in zip(self._fields(), self._key(obj))
+        ]
+        data = json.dumps([direction, values]).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, raw_values = json.loads(data.decode())
+            fields = list(self._fields())
+            if direction not in (NEXT, PREVIOUS):
+                raise InvalidCursor('Неизвестное направление курсора')
+            if len(raw_values) != len(fields):
+                raise InvalidCursor('Курсор не совпадает с сортировкой')
+            values = [
+                field.to_python(value)
+                for (_, field, _), value in zip(fields, raw_values)
+            ]
+        except (
+            binascii.Error, UnicodeDecodeError,
+            TypeError, ValueError, ValidationError,
+        ) as error:
+            raise InvalidCursor(str(error))
+        return direction, values
+
+    def _seek(self, values, direction):
+        """Условие «строго после курсора» в направлении выборки."""
+        condition = Q()
+        equal = {}
+        for (attname, _, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending == (direction == NEXT) else 'gt'
+            condition |= Q(**equal, **{f'{attname}__{lookup}': value})
+            equal[attname] = value
+        return condition
+
+    def _fetch(self, queryset, values, direction):
+        """Первые per_page + 1 записей после курсора в направлении
+        выборки."""
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, direction))
+        if direction == PREVIOUS:
+            queryset = queryset.reverse()
+        return list(queryset[:self.per_page + 1])
+
+    def page(self, cursor=None):
+        if not cursor:
+            object_list = self._fetch(self.object_list, None, NEXT)
+            has_next = len(object_list) > self.per_page
+            return CursorPage(
+                object_list[:self.per_page], self, has_next, False
+            )
+        direction, values = self.decode_cursor(cursor)
+        object_list = self._fetch(self.object_list, values, direction)
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if direction == PREVIOUS:
+            object_list.reverse()
+            return CursorPage(object_list, self, True, has_more)
+        return CursorPage(object_list, self, has_more, True)
+
+    def get_page(self, cursor=None):
+        """Как и Paginator.get_page, на ошибочный курсор отдаёт первую
+        страницу."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Курсорная пагинация ленты из нескольких запросов-источников.
+
+    Каждый источник выбирает свою страницу по собственному индексу,
+    а страница ленты собирается слиянием их страниц, без сортировки
+    объединения в базе. Источники отдают одни и те же поля сортировки;
+    запись, попавшая в несколько источников, выводится один раз.
+    """
+
+    def __init__(self, sources, per_page, ordering=DEFAULT_ORDERING):
+        self.sources = [source.order_by(*ordering) for source in sources]
+        super().__init__(sources[0], per_page, ordering)
+
+    def _fetch(self, queryset, values, direction):
+        rows = {}
+        for source in self.sources:
+            for obj in super()._fetch(source, values, direction):
+                rows.setdefault(self._key(obj), obj)
+        object_list = list(rows.values())
+        # Устойчивая сортировка с последнего поля до первого
+        fields = list(enumerate(self._fields()))
+        for index, (_, _, descending) in reversed(fields):
+            object_list.sort(
+                key=lambda obj: self._key(obj)[index],
+                reverse=descending == (direction == NEXT),
+            )
+        return object_list[:self.per_page + 1]
+
+
+def get_page_obj(request, queryset, per_page, ordering=None):
+    """Возвращает страницу ленты: курсорную, если она включена
+    в настройках или в запросе передан параметр `cursor`.
+
+    ordering - сортировка ленты; по умолчанию постраничная выборка
+    сохраняет сортировку запроса, а курсорная идёт по DEFAULT_ORDERING.
+    Вместо запроса можно передать список источников: такая лента
+    всегда курсорная, номер страницы потребовал бы сортировать их
+    объединение.
+    """
+    cursor_ordering = ordering or DEFAULT_ORDERING
+    if isinstance(queryset, list):
+        paginator = MergedCursorPaginator(queryset, per_page, cursor_ordering)
+        return paginator.get_page(request.GET.get('cursor'))
+    if settings.POSTS_CURSOR_PAGINATION or 'cursor' in request.GET:
+        paginator = CursorPaginator(queryset, per_page, cursor_ordering)
+        return paginator.get_page(request.GET.get('cursor'))
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    paginator = Paginator(queryset, per_page)
+    return paginator.get_page(request.GET.get('page'))
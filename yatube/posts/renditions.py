@@ -0,0 +1,76 @@
+"""Адаптивные копии картинок постов.
+
+Для каждой картинки в отдельном каталоге `renditions/` сохраняются
+копии нескольких ширин с пропорциями карточки поста в JPEG и, если
+Pillow собран с libwebp, в WebP. Шаблоны отдают их через `srcset`,
+чтобы мобильные клиенты не скачивали картинку крупнее экрана.
+
+Имя копии - полное имя оригинала с расширением, поэтому у a.jpg и
+a.png копии разные. Пересоздавая копии, модуль удаляет файлы только
+внутри `renditions/` и никогда не трогает загруженные оригиналы.
+"""
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+WIDTHS = (480, 960, 1440)
+RATIO = 339 / 960  # Пропорции миниатюры карточки поста
+# Браузер выбирает первый поддерживаемый формат, поэтому WebP идёт первым
+FORMATS = {'webp': 'WEBP'} if features.check('webp') else {}
+FORMATS['jpg'] = 'JPEG'
+QUALITY = 80
+PREFIX = 'renditions/'
+
+
+def rendition_name(name, width, extension):
+    return posixpath.join(PREFIX, f'{name}_{width}w.{extension}')
+
+
+def exist(name):
+    """Созданы ли копии: последней создаётся самая широкая JPEG."""
+    last_extension = list(FORMATS)[-1]
+    return default_storage.exists(
+        rendition_name(name, WIDTHS[-1], last_extension)
+    )
+
+
+def sources(name):
+    """Форматы копий с MIME-типом и значением srcset для <picture>."""
+    return [
+        {
+            'type': f'image/{image_format.lower()}',
+            'srcset': ', '.join(
+                f'{default_storage.url(rendition_name(name, width, ext))} '
+                f'{width}w'
+                for width in WIDTHS
+            ),
+        }
+        for ext, image_format in FORMATS.items()
+    ]
+
+
+def create(name, force=False):
+    """Создаёт копии картинки. Возвращает True, если что-то создано."""
+    if not force and exist(name):
+        return False
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    for width in WIDTHS:
+        resized = ImageOps.fit(
+            image, (width, round(width * RATIO)), Image.LANCZOS
+        )
+        for extension, image_format in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=QUALITY)
+            target = rendition_name(name, width, extension)
+            if not posixpath.normpath(target).startswith(PREFIX):
+                raise ValueError(f'Копия {target!r} вне {PREFIX}')
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+    return True
@@ -0,0 +1,148 @@
+"""Полнотекстовый поиск по постам.
+
+Бэкенд задаётся настройкой `POSTS_SEARCH_BACKEND`. Индекс хранит
+основы слов (см. `posts.stemmer`), поэтому поиск не зависит от формы
+слова. Индекс обновляется сигналами при сохранении и удалении поста.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Post
+from .stemmer import WORD_RE, stem, stem_text
+
+BATCH_SIZE = 500  # Размер пачки при перестроении индекса
+
+
+class BaseSearchBackend:
+    def index(self, post):
+        """Добавляет пост в индекс или обновляет его."""
+        raise NotImplementedError
+
+    def remove(self, post_id):
+        """Удаляет пост из индекса."""
+        raise NotImplementedError
+
+    def index_many(self, posts):
+        """Добавляет в индекс пачку постов."""
+        for post in posts:
+            self.index(post)
+
+    def search(self, query, queryset=None):
+        """Посты из queryset (по умолчанию все), в которых есть
+        все слова запроса."""
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Перестраивает индекс по всем постам. Возвращает их количество."""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Поиск без индекса через LIKE, для баз без полнотекстового поиска."""
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def index_many(self, posts):
+        pass
+
+    def search(self, query, queryset=None):
+        posts = Post.objects.all() if queryset is None else queryset
+        words = WORD_RE.findall(query)
+        if not words:
+            return posts.none()
+        for word in words:
+            posts = posts.filter(text__icontains=word)
+        return posts
+
+    def rebuild(self):
+        return Post.objects.count()
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Инвертированный индекс на виртуальной таблице SQLite FTS5.
+
+    rowid записи индекса совпадает с id поста.
+    """
+    table = 'posts_post_fts'
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, body) VALUES (%s, %s)',
+                [post.pk, stem_text(post.text)],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post_id]
+            )
+
+    def index_many(self, posts):
+        posts = list(posts)
+        if not posts:
+            return
+        placeholders = ', '.join(['%s'] * len(posts))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                [post.pk for post in posts],
+            )
+            self._insert(
+                cursor, [(post.pk, stem_text(post.text)) for post in posts]
+            )
+
+    def match_expression(self, query):
+        """Выражение MATCH: все основы слов запроса как префиксы."""
+        return ' '.join(
+            '"{}"*'.format(stem(word)) for word in WORD_RE.findall(query)
+        )
+
+    def search(self, query, queryset=None):
+        posts = Post.objects.all() if queryset is None else queryset
+        expression = self.match_expression(query)
+        if not expression:
+            return posts.none()
+        # Через RawSQL подзапрос попал бы в двойные скобки, и SQLite
+        # воспринял бы его как скаляр из одной строки
+        return posts.extra(
+            where=[
+                f'{Post._meta.db_table}.id IN (SELECT rowid FROM '
+                f'{self.table} WHERE {self.table} MATCH %s)'
+            ],
+            params=[expression],
+        )
+
+    def rebuild(self):
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            posts = Post.objects.order_by().values_list('pk', 'text')
+            batch = []
+            for pk, text in posts.iterator():
+                batch.append((pk, stem_text(text)))
+                if len(batch) == BATCH_SIZE:
+                    self._insert(cursor, batch)
+                    total += len(batch)
+                    batch = []
+            self._insert(cursor, batch)
+        return total + len(batch)
+
+    def _insert(self, cursor, rows):
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, body) VALUES (%s, %s)',
+                rows,
+            )
+
+
+def get_search_backend():
+    return import_string(settings.POSTS_SEARCH_BACKEND)()
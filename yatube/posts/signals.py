@@ -0,0 +1,221 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, streams, timeline, trending
+from .caching import (
+    AUTHOR_VERSION_KEY, FEED_VERSION_KEY, FOLLOW_VERSION_KEY,
+    GROUP_PAGE_VERSION_KEY, GROUP_VERSION_KEY, GROUPS_PAGE_VERSION_KEY,
+    POST_PAGE_VERSION_KEY, POST_RELATED_KEY, PROFILE_PAGE_VERSION_KEY,
+    bump_post_pages, bump_version, page_version_key,
+)
+from .models import Comment, Follow, Group, GroupStats, Post
+from .search import get_search_backend
+
+User = get_user_model()
+
+# Счётчики обновляются раньше лент: по числу подписчиков автора
+# решается, раскладывать ли его посты по лентам.
+
+
+@receiver(post_save, sender=Post)
+def post_counted(sender, instance, created, **kwargs):
+    """Увеличивает счётчик постов автора."""
+    if created:
+        counters.increment_user(instance.author_id, 'posts_count')
+
+
+@receiver(post_delete, sender=Post)
+def post_uncounted(sender, instance, **kwargs):
+    """Уменьшает счётчик постов автора."""
+    counters.decrement_user(instance.author_id, 'posts_count')
+
+
+@receiver(post_save, sender=Comment)
+def comment_counted(sender, instance, created, **kwargs):
+    """Увеличивает счётчик комментариев поста."""
+    if created:
+        counters.increment_comments(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncounted(sender, instance, **kwargs):
+    """Уменьшает счётчик комментариев поста."""
+    counters.decrement_comments(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(sender, instance, created, **kwargs):
+    """Увеличивает счётчики подписок и подписчиков."""
+    if created:
+        counters.increment_user(instance.user_id, 'following_count')
+        counters.increment_user(instance.author_id, 'followers_count')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(sender, instance, **kwargs):
+    """Уменьшает счётчики подписок и подписчиков."""
+    counters.decrement_user(instance.user_id, 'following_count')
+    counters.decrement_user(instance.author_id, 'followers_count')
+
+
+@receiver(post_save, sender=Post)
+def post_published(sender, instance, created, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_scored(sender, instance, created, **kwargs):
+    """Ставит новый пост в рейтинг популярного."""
+    if created:
+        trending.score_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_scored(sender, instance, created, **kwargs):
+    if created:
+        trending.score_comment(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_scored(sender, instance, created, **kwargs):
+    if created:
+        trending.score_follow(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_announced(sender, instance, created, **kwargs):
+    """Сообщает открытым лентам о новом посте."""
+    if created:
+        streams.publish_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """Заполняет ленту постами автора, на которого подписались."""
+    if created:
+        timeline.mark_pulled([instance.author_id])
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Очищает ленту от постов автора после отписки."""
+    timeline.prune(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def feed_changed(sender, **kwargs):
+    """Сбрасывает закэшированные фрагменты лент и валидаторы
+    страниц."""
+    bump_version(FEED_VERSION_KEY)
+
+
+@receiver(pre_save, sender=Post)
+def post_group_remembered(sender, instance, **kwargs):
+    """Запоминает прежнюю группу поста, чтобы сбросить и её страницы."""
+    instance._previous_group_id = None
+    if not instance._state.adding:
+        instance._previous_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_pages_changed(sender, instance, **kwargs):
+    """Сбрасывает закэшированные страницы поста, его автора и групп."""
+    cache.delete(POST_RELATED_KEY.format(instance.pk))
+    group_ids = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    } - {None}
+    bump_post_pages(
+        instance.pk, instance.author.username,
+        Group.objects.filter(pk__in=group_ids).values_list('slug', flat=True),
+    )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def author_posts_changed(sender, instance, created=True, **kwargs):
+    """Сбрасывает страницы постов автора, когда меняется число его
+    постов."""
+    if created:
+        bump_version(AUTHOR_VERSION_KEY.format(instance.author_id))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """Сбрасывает страницы постов пользователя: на них его имя.
+    Вход пользователя (запись last_login) их не меняет."""
+    if update_fields == frozenset({'last_login'}):
+        return
+    bump_version(AUTHOR_VERSION_KEY.format(instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_pages_changed(sender, instance, **kwargs):
+    """Сбрасывает закэшированную страницу поста, а также страницы его
+    автора и группы: в их карточках число комментариев."""
+    bump_version(
+        page_version_key(POST_PAGE_VERSION_KEY, post_id=instance.post_id)
+    )
+    row = Post.objects.filter(pk=instance.post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if row is None:
+        return
+    username, slug = row
+    bump_version(page_version_key(PROFILE_PAGE_VERSION_KEY, username=username))
+    if slug is not None:
+        bump_version(page_version_key(GROUP_PAGE_VERSION_KEY, slug=slug))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_pages_changed(sender, instance, **kwargs):
+    """Сбрасывает закэшированные страницы группы, каталог групп
+    и страницы постов группы."""
+    bump_version(GROUP_VERSION_KEY.format(instance.pk))
+    bump_version(page_version_key(GROUP_PAGE_VERSION_KEY, slug=instance.slug))
+    bump_version(GROUPS_PAGE_VERSION_KEY)
+
+
+@receiver(post_save, sender=Group)
+def group_created(sender, instance, created, **kwargs):
+    """Новая группа попадает в каталог сразу, её сводку заполнит
+    следующий пересчёт."""
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    """Сбрасывает закэшированную ленту подписок пользователя и страницу
+    автора: на ней число подписчиков."""
+    bump_version(FOLLOW_VERSION_KEY.format(instance.user_id))
+    bump_version(page_version_key(
+        PROFILE_PAGE_VERSION_KEY, username=instance.author.username
+    ))
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, **kwargs):
+    """Обновляет пост в поисковом индексе."""
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    """Удаляет пост из поискового индекса."""
+    get_search_backend().remove(instance.pk)
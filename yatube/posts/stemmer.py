@@ -0,0 +1,141 @@
+"""Стеммер для русского языка по алгоритму Snowball.
+
+Поиск индексирует и ищет основы слов, поэтому «котами» находит «кот».
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    (),
+    (
+        'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+        'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+        'ая', 'яя', 'ою', 'ею',
+    ),
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+        'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+        'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = (
+    (),
+    (
+        'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+        'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+        'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+        'ья', 'я',
+    ),
+)
+SUPERLATIVE = ((), ('ейше', 'ейш'))
+DERIVATIONAL = ((), ('ость', 'ост'))
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _regions(word):
+    """Начала областей RV и R2 (R1 нужна только для поиска R2)."""
+    rv = r1 = r2 = len(word)
+    for i, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, groups):
+    """Отрезает самое длинное окончание из групп.
+
+    Окончания первой группы отрезаются, только если перед ними стоит
+    «а» или «я». Возвращает None, если отрезать нечего.
+    """
+    after_a, plain = groups
+    endings = sorted(
+        [(ending, True) for ending in after_a]
+        + [(ending, False) for ending in plain],
+        key=lambda item: len(item[0]),
+        reverse=True,
+    )
+    for ending, needs_a in endings:
+        if not word.endswith(ending):
+            continue
+        stem = word[:-len(ending)]
+        if needs_a and not stem.endswith(('а', 'я')):
+            return None
+        return stem
+    return None
+
+
+def _step_one(rest):
+    """Деепричастие, иначе возвратность и прилагательное, глагол
+    или существительное."""
+    stripped = _strip(rest, PERFECTIVE_GERUND)
+    if stripped is not None:
+        return stripped
+    stripped = _strip(rest, REFLEXIVE)
+    if stripped is not None:
+        rest = stripped
+    stripped = _strip(rest, ADJECTIVE)
+    if stripped is not None:
+        participle = _strip(stripped, PARTICIPLE)
+        return stripped if participle is None else participle
+    for groups in (VERB, NOUN):
+        stripped = _strip(rest, groups)
+        if stripped is not None:
+            return stripped
+    return rest
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    prefix, rest = word[:rv], word[rv:]
+    rest = _step_one(rest)
+
+    # Конечная «и»
+    if rest.endswith('и'):
+        rest = rest[:-1]
+
+    # Словообразовательное окончание в R2
+    r2_part = (prefix + rest)[r2:]
+    if _strip(r2_part, DERIVATIONAL) is not None:
+        rest = _strip(rest, DERIVATIONAL)
+
+    # Превосходная степень, «нн», мягкий знак
+    stripped = _strip(rest, SUPERLATIVE)
+    if stripped is not None:
+        rest = stripped
+        if rest.endswith('нн'):
+            rest = rest[:-1]
+    elif rest.endswith('нн') or rest.endswith('ь'):
+        rest = rest[:-1]
+    return prefix + rest
+
+
+def stem_text(text):
+    """Текст, в котором каждое слово заменено основой."""
+    return ' '.join(stem(word) for word in WORD_RE.findall(text.lower()))
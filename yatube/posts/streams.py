@@ -0,0 +1,108 @@
+"""Поток «N новых постов» для главной и ленты подписок.
+
+Открытая страница ленты подключается к потоку server-sent events
+и показывает, сколько постов появилось с её загрузки, вместо того
+чтобы пользователь перезагружал страницу. Новые посты приходят через
+брокер `core.broker`: общая лента слушает канал всех постов, лента
+подписок - каналы авторов, на которых подписан пользователь. Брокер
+доставляет только события своего процесса, поэтому при нескольких
+процессах сервера счётчик учитывает не все новые посты; после
+переподключения он досчитывается запросом к базе.
+
+Поток держит соединение и поток ASGI-сервера до STREAM_TIMEOUT, поэтому
+открывается только под ASGI.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from core.broker import broker
+
+from .models import Follow, Post
+
+POSTS_CHANNEL = 'posts'
+AUTHOR_CHANNEL = 'posts:author:{}'
+RETRY_MS = 5000  # Через сколько браузер переподключится после обрыва
+
+
+def publish_post(post):
+    """Сообщает подписчикам о посте, когда транзакция зафиксирована:
+    откаченный пост не должен появиться в счётчике."""
+    def publish():
+        broker.publish(POSTS_CHANNEL, post.pk)
+        broker.publish(AUTHOR_CHANNEL.format(post.author_id), post.pk)
+    transaction.on_commit(publish)
+
+
+def feed_source(feed, user):
+    """Каналы ленты и её посты."""
+    if feed == 'follow':
+        authors = list(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        channels = [AUTHOR_CHANNEL.format(author) for author in authors]
+        return channels, Post.objects.filter(author_id__in=authors)
+    return [POSTS_CHANNEL], Post.objects.all()
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+class NewPostsStream:
+    """Итератор событий потока. Подписка закрывается в close(), даже
+    если поток не успели начать читать: StreamingHttpResponse вызывает
+    close() у переданного ему объекта."""
+
+    def __init__(self, subscription, posts, after=None):
+        self.subscription = subscription
+        self.posts = posts
+        self.after = after
+
+    def __iter__(self):
+        try:
+            yield from self._events()
+        finally:
+            self.close()
+
+    def _events(self):
+        # Подписка уже открыта: пост, созданный после этого запроса,
+        # придёт через брокер, а учтённые здесь отсекаются по id
+        if self.after is None:
+            count = 0
+            last = self.posts.aggregate(last=Max('pk'))['last'] or 0
+        else:
+            newer = self.posts.filter(pk__gt=self.after).aggregate(
+                count=Count('pk'), last=Max('pk')
+            )
+            count = newer['count']
+            last = newer['last'] or self.after
+        yield f'retry: {RETRY_MS}\n\n'
+        if count:
+            yield _event('new_posts', {'count': count})
+        deadline = time.monotonic() + settings.STREAM_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Браузер переподключится, а поток освободится
+                return
+            post_id = self.subscription.get(
+                min(settings.STREAM_HEARTBEAT, remaining)
+            )
+            if self.subscription.closed:
+                return
+            if post_id is None:
+                # Комментарий не даёт прокси закрыть соединение
+                # и позволяет заметить, что клиент ушёл
+                yield ': ping\n\n'
+            elif post_id > last:
+                count += 1
+                yield _event('new_posts', {'count': count})
+
+    def close(self):
+        self.subscription.close()
@@ -0,0 +1,31 @@
+from django import template
+
+from posts import renditions, thumbnails
+from posts.caching import skip_page_cache
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_ready(image):
+    """Готова ли миниатюра карточки; если нет — ставит её создание
+    в очередь."""
+    if not image:
+        return False
+    if thumbnails.is_ready(image):
+        return True
+    thumbnails.schedule(image)
+    # Заглушка не должна остаться в кэше страниц
+    skip_page_cache()
+    return False
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(image, url):
+    """Миниатюра карточки с адаптивными копиями, если они созданы."""
+    sources = []
+    if renditions.exist(image.name):
+        sources = renditions.sources(image.name)
+    else:
+        skip_page_cache()
+    return {'sources': sources, 'url': url}
@@ -0,0 +1,111 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {number}', group=cls.group
+            )
+            for number in range(15)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def get(self, name, params=None, **kwargs):
+        return self.guest_client.get(reverse(name, kwargs=kwargs), params)
+
+    def test_feeds(self):
+        """Ленты отдают те же посты, что и HTML-страницы."""
+        feeds = {
+            'posts:api_index': {},
+            'posts:api_group_list': {'slug': 'group'},
+            'posts:api_profile': {'username': 'Author'},
+        }
+        newest = self.posts[-1]
+        for name, kwargs in feeds.items():
+            with self.subTest(name=name):
+                data = self.get(name, **kwargs).json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(data['results'][0], {
+                    'id': newest.pk,
+                    'text': newest.text,
+                    'pub_date': data['results'][0]['pub_date'],
+                    'author': 'Author',
+                    'group': 'group',
+                    'image': None,
+                    'comments_count': 0,
+                })
+                self.assertIsNone(data['previous'])
+
+    def test_cursor_pagination(self):
+        """Курсор ведёт на следующую страницу и обратно."""
+        first = self.get('posts:api_index', {'fields': 'id'}).json()
+        second = self.get(
+            'posts:api_index', {'fields': 'id', 'cursor': first['next']}
+        ).json()
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+        self.assertIsNone(second['next'])
+        back = self.get(
+            'posts:api_index', {'fields': 'id', 'cursor': second['previous']}
+        ).json()
+        self.assertEqual(back['results'], first['results'])
+        response = self.get('posts:api_index', {'cursor': 'мусор'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_field_selection(self):
+        """Из базы читаются и отдаются только запрошенные поля."""
+        with self.assertNumQueries(1) as context:
+            data = self.get(
+                'posts:api_index', {'fields': 'id,author'}
+            ).json()
+        self.assertEqual(
+            data['results'][0], {'id': self.posts[-1].pk, 'author': 'Author'}
+        )
+        sql = context.captured_queries[0]['sql']
+        self.assertNotIn('"text"', sql)
+        response = self.get('posts:api_index', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('password', response.json()['error'])
+
+    def test_post_detail(self):
+        post = self.posts[0]
+        data = self.get(
+            'posts:api_post', {'fields': 'text,group'}, post_id=post.pk
+        ).json()
+        self.assertEqual(data, {'text': post.text, 'group': 'group'})
+        response = self.get('posts:api_post', post_id=post.pk + 100)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_follow_feed(self):
+        """Лента подписок требует авторизации."""
+        response = self.get('posts:api_follow_index')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.guest_client.force_login(self.reader)
+        data = self.get('posts:api_follow_index', {'fields': 'id'}).json()
+        self.assertEqual(data['results'][0], {'id': self.posts[-1].pk})
+
+    def test_read_only(self):
+        response = self.guest_client.post(reverse('posts:api_index'))
+        self.assertEqual(
+            response.status_code, HTTPStatus.METHOD_NOT_ALLOWED
+        )
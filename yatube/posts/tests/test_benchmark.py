@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.db.models import F
+from django.test import TestCase
+
+from .. import benchmark
+from ..models import Comment, Post, TimelineEntry
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        benchmark.seed(users=5, groups=2, posts=30, comments=20, follows=6)
+
+    def test_seed(self):
+        """seed создаёт данные и перестраивает производные таблицы."""
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertTrue(TimelineEntry.objects.exists())
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+
+    def test_seed_dates(self):
+        """Посты распределены во времени в порядке id, комментарии
+        написаны после своих постов."""
+        dates = list(
+            Post.objects.order_by('pk').values_list('pub_date', flat=True)
+        )
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreater(dates[-1] - dates[0], timedelta(days=1))
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date')).exists()
+        )
+
+    def test_run(self):
+        """Прогон замеряет все сценарии."""
+        results = benchmark.run(requests=2, warmup=0)
+        self.assertIn('follow_index', results)
+        for result in results.values():
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+
+    def test_compare(self):
+        """Сравнение с эталоном находит рост задержки и числа запросов."""
+        baseline = {'index': {'p90': 10, 'queries': 3}}
+        current = {'index': {'p90': 11, 'queries': 3}}
+        self.assertEqual(benchmark.compare(current, baseline, 0.2), [])
+        current = {'index': {'p90': 13, 'queries': 4}}
+        self.assertEqual(len(benchmark.compare(current, baseline, 0.2)), 2)
@@ -0,0 +1,81 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..group_stats import aggregate
+from ..models import Group, GroupStats, Post
+
+User = get_user_model()
+
+
+class GroupDirectoryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.leo = User.objects.create_user(
+            username='leo', first_name='Лев', last_name='Толстой'
+        )
+        cls.anna = User.objects.create_user(username='anna')
+        cls.big = Group.objects.create(
+            title='Большая', slug='big', description='-'
+        )
+        cls.small = Group.objects.create(
+            title='Маленькая', slug='small', description='-'
+        )
+        for _ in range(3):
+            Post.objects.create(author=cls.leo, group=cls.big, text='Пост')
+        cls.last = Post.objects.create(
+            author=cls.anna, group=cls.big, text='Пост'
+        )
+        Post.objects.create(author=cls.anna, group=cls.small, text='Пост')
+        Post.objects.create(author=cls.anna, text='Без группы')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_aggregate(self):
+        """Сводка считает посты, последнюю активность и авторов."""
+        comment = self.last.comments.create(author=self.leo, text='Да')
+        self.assertEqual(aggregate(), 2)
+        stats = GroupStats.objects.get(group=self.big)
+        self.assertEqual(stats.posts_count, 4)
+        self.assertEqual(stats.last_activity, comment.created)
+        self.assertEqual(stats.get_top_authors(), [
+            {'username': 'leo', 'name': 'Лев Толстой', 'posts': 3},
+            {'username': 'anna', 'name': '', 'posts': 1},
+        ])
+
+    def test_new_group_listed(self):
+        """Новая группа сразу есть в каталоге, с нулями до пересчёта."""
+        group = Group.objects.create(
+            title='Новая', slug='new', description='-'
+        )
+        self.assertEqual(group.stats.posts_count, 0)
+        self.assertIsNone(group.stats.last_activity)
+
+    def test_directory_page(self):
+        """Каталог читает сводку одним запросом на страницу, большие
+        группы первыми."""
+        call_command('aggregate_groups', stdout=StringIO())
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('posts:group_index'))
+        groups = [stats.group for stats in response.context['page_obj']]
+        self.assertEqual(groups, [self.big, self.small])
+        self.assertContains(response, 'Лев Толстой')
+
+    def test_directory_refreshed_by_aggregation(self):
+        """Закэшированный каталог обновляется после пересчёта."""
+        aggregate()
+        self.client.get(reverse('posts:group_index'))
+        Post.objects.create(author=self.anna, group=self.small, text='Ещё')
+        Post.objects.create(author=self.anna, group=self.small, text='Ещё')
+        response = self.client.get(reverse('posts:group_index'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        aggregate()
+        response = self.client.get(reverse('posts:group_index'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Постов: 3')
@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..importer import Importer
+from ..models import Follow, Group, Post, TimelineEntry, TrendingScore
+from ..search import get_search_backend
+
+User = get_user_model()
+
+
+class ImportContentTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        User.objects.create_user(username='existing')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_jsonl(self, name, records):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def write_csv(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def test_import(self):
+        """Записи из JSONL и CSV импортируются со связями по username,
+         slug и id поста из исходных данных."""
+        paths = [
+            # Порядок файлов не важен
+            self.write_jsonl('comments.jsonl', [
+                {'post': 'p1', 'author': 'existing', 'text': 'Комментарий'},
+            ]),
+            self.write_jsonl('posts.jsonl', [
+                {'id': 'p1', 'author': 'leo', 'text': 'Первый',
+                 'group': 'cats', 'pub_date': '2020-01-02T03:04:05'},
+                {'id': 'p2', 'author': 'leo', 'text': 'Второй'},
+            ]),
+            self.write_csv(
+                'users.csv', 'username,first_name\nleo,Лев\nexisting,\n'
+            ),
+            self.write_csv(
+                'groups.csv', 'slug,title\ncats,Кошки\n'
+            ),
+            self.write_csv(
+                'follows.csv', 'user,author\nexisting,leo\n'
+            ),
+        ]
+        out = StringIO()
+        call_command('import_content', *paths, batch_size=1, stdout=out)
+        self.assertIn('записей/с', out.getvalue())
+        self.assertEqual(User.objects.count(), 2)
+        leo = User.objects.get(username='leo')
+        first = Post.objects.get(text='Первый')
+        self.assertEqual(first.author, leo)
+        self.assertEqual(first.group, Group.objects.get(slug='cats'))
+        self.assertEqual(first.pub_date.year, 2020)
+        self.assertEqual(first.comments.get().text, 'Комментарий')
+        self.assertEqual(first.comments_count, 1)
+        self.assertEqual(leo.stats.posts_count, 2)
+        self.assertTrue(Follow.objects.filter(author=leo).exists())
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+        # Новые посты после импорта получают свободные id
+        post = Post.objects.create(author=leo, text='Новый')
+        self.assertGreater(post.pk, first.pk)
+
+    @override_settings(POSTS_TIMELINE_BACKFILL=1)
+    def test_import_updates_only_imported_records(self):
+        """Импорт обновляет ленты, рейтинг и поиск только для новых
+         записей: существующие ленты не обрезаются до размера
+         заполнения при подписке, вклад подписок в рейтинг
+         сохраняется."""
+        reader = User.objects.get(username='existing')
+        author = User.objects.create_user(username='author')
+        Follow.objects.create(user=reader, author=author)
+        old_posts = [
+            Post.objects.create(author=author, text=f'Старый {i}')
+            for i in range(3)
+        ]
+        fan = User.objects.create_user(username='fan')
+        Follow.objects.create(user=fan, author=author)
+        scores = dict(TrendingScore.objects.values_list('post', 'score'))
+        path = self.write_jsonl('posts.jsonl', [
+            {'author': 'author', 'text': 'Импортированный'},
+        ])
+        call_command('import_content', path, stdout=StringIO())
+        post = Post.objects.get(text='Импортированный')
+        timeline = TimelineEntry.objects.filter(user=reader)
+        self.assertEqual(
+            set(timeline.values_list('post', flat=True)),
+            {post.pk, *(old.pk for old in old_posts)}
+        )
+        for old in old_posts:
+            self.assertEqual(
+                TrendingScore.objects.get(post=old).score, scores[old.pk]
+            )
+        self.assertTrue(TrendingScore.objects.filter(post=post).exists())
+        author.stats.refresh_from_db()
+        self.assertEqual(author.stats.posts_count, 4)
+        self.assertEqual(
+            list(get_search_backend().search('Импортированный')), [post]
+        )
+
+    def test_import_queries_per_batch(self):
+        """Число запросов на пачку не зависит от числа записей в ней."""
+        def import_queries(prefix, count):
+            importer = Importer()
+            paths = [
+                self.write_jsonl(f'{prefix}users.jsonl', [
+                    {'username': f'{prefix}{i}'} for i in range(count)
+                ]),
+                self.write_jsonl(f'{prefix}follows.jsonl', [
+                    {'user': f'{prefix}{i}', 'author': 'existing'}
+                    for i in range(count)
+                ]),
+                self.write_jsonl(f'{prefix}posts.jsonl', [
+                    {'id': f'{prefix}{i}', 'author': 'existing',
+                     'text': f'Пост {i}'}
+                    for i in range(count)
+                ]),
+                self.write_jsonl(f'{prefix}comments.jsonl', [
+                    {'post': f'{prefix}{i}', 'author': f'{prefix}{i}',
+                     'text': 'Комментарий'}
+                    for i in range(count)
+                ]),
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                for path in paths:
+                    kind = os.path.basename(path)[len(prefix):-6]
+                    importer.import_file(kind, path)
+            return len(queries)
+
+        # Первый импорт создаёт счётчики автора и выделяет id
+        import_queries('a', 1)
+        self.assertEqual(import_queries('b', 2), import_queries('c', 20))
+        author = User.objects.get(username='existing')
+        self.assertEqual(author.stats.followers_count, 23)
+        self.assertEqual(author.stats.posts_count, 23)
+        self.assertEqual(
+            Post.objects.filter(comments_count=1).count(), 23
+        )
+
+    def test_unknown_reference(self):
+        """Ссылка на неизвестного пользователя отменяет весь импорт."""
+        paths = [
+            self.write_csv('groups.csv', 'slug,title\ncats,Кошки\n'),
+            self.write_jsonl('posts.jsonl', [
+                {'author': 'nobody', 'text': 'Пост'},
+            ]),
+        ]
+        with self.assertRaisesMessage(CommandError, 'nobody'):
+            call_command('import_content', *paths, stdout=StringIO())
+        self.assertFalse(Group.objects.exists())
+        self.assertFalse(Post.objects.exists())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        cls.posts[0].group = cls.group
+        cls.posts[0].save()
+        cls.posts[1].comments.create(author=cls.user, text='Комментарий')
+
+    def setUp(self):
+        self.client.force_login(ExportTests.user)
+
+    def test_export_view_streams(self):
+        """Выгрузка отдаётся потоком в JSON Lines и CSV."""
+        response = self.client.get(reverse('posts:export'))
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [row['text'] for row in rows], ['Пост 0', 'Пост 1', 'Пост 2']
+        )
+        self.assertEqual(rows[0]['group'], 'group')
+        response = self.client.get(
+            reverse('posts:export'), {'kind': 'comments', 'format': 'csv'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(
+            response.streaming_content
+        ).decode().splitlines()
+        self.assertEqual(lines[0], 'id,post,author,text,created')
+        self.assertIn('Комментарий', lines[1])
+
+    def test_export_requires_login(self):
+        """Выгрузка доступна только авторизованному пользователю."""
+        self.client.logout()
+        response = self.client.get(reverse('posts:export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_import_round_trip(self):
+        """Выгрузку можно загрузить обратно командой import_content."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for kind in ('posts', 'comments'):
+            call_command(
+                'export_user', 'writer', kind=kind,
+                output=os.path.join(directory, f'{kind}.jsonl'),
+            )
+        Post.objects.all().delete()
+        call_command(
+            'import_content',
+            os.path.join(directory, 'posts.jsonl'),
+            os.path.join(directory, 'comments.jsonl'),
+            stdout=StringIO(),
+        )
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Пост 0', 'Пост 1', 'Пост 2'],
+        )
+        post = Post.objects.get(text='Пост 1')
+        self.assertEqual(post.comments.get().text, 'Комментарий')
+        self.assertEqual(Post.objects.get(text='Пост 0').group, self.group)
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post, Comment, Follow
+from ..models import Group, Post, Comment, Follow, UserStats
 
 User = get_user_model()
 
@@ -163,3 +166,74 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     follow._meta.get_field(field).verbose_name, expected_value
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+
+    def assertCounters(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_counters_follow_changes(self):
+        """Счётчики обновляются при создании и удалении постов,
+         комментариев и подписок."""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=CountersTest.user, text='Комментарий'
+        )
+        follow = Follow.objects.create(
+            user=CountersTest.user, author=CountersTest.author
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertCounters(CountersTest.author, 1, 1, 0)
+        self.assertCounters(CountersTest.user, 0, 0, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertCounters(CountersTest.author, 1, 0, 0)
+        self.assertCounters(CountersTest.user, 0, 0, 0)
+        post.delete()
+        self.assertCounters(CountersTest.author, 0, 0, 0)
+
+    def test_save_keeps_counters(self):
+        """Сохранение прочитанного ранее поста не откатывает счётчик
+        комментариев."""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(
+            post=post, author=CountersTest.user, text='Комментарий'
+        )
+        stale.text = 'Исправленный пост'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Исправленный пост')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_rebuild_counters_command(self):
+        """Команда rebuild_counters пересчитывает счётчики по базе."""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        Comment.objects.create(
+            post=post, author=CountersTest.user, text='Комментарий'
+        )
+        Follow.objects.create(
+            user=CountersTest.user, author=CountersTest.author
+        )
+        UserStats.objects.update(
+            posts_count=10, followers_count=10, following_count=10
+        )
+        Post.objects.update(comments_count=10)
+        call_command('rebuild_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertCounters(CountersTest.author, 1, 1, 0)
+        self.assertCounters(CountersTest.user, 0, 0, 1)
@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from ..models import Follow, Post, Group
@@ -43,6 +46,26 @@ class PaginatorViewsTest(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
+    def test_cached_fragment_skips_feed_queries(self):
+        """Если фрагмент ленты есть в кэше, ни посты, ни их число
+         не читаются из базы."""
+        cache.clear()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:index') + '?cursor=',
+            reverse('posts:follow_index'),
+            reverse('posts:follow_index') + '?cursor=',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.authorized_client.get(url)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.authorized_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                for query in context.captured_queries:
+                    self.assertNotIn('posts_', query['sql'])
+
     def test_pages_contains_records(self):
         """Количество постов на страницах index, post_group, profile,
          follow соответствует ожидаемому."""
@@ -77,3 +100,70 @@ class PaginatorViewsTest(TestCase):
             reverse('posts:follow_index') + '?page=2'
         )
         self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_cursor_pages_contains_records(self):
+        """Курсорная пагинация проходит ленту вперёд и назад
+         без пропусков и повторов."""
+        url = reverse('posts:index')
+        response = self.guest_client.get(url + '?cursor=')
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), 10)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        response = self.guest_client.get(
+            url + f'?cursor={first_page.next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            list(first_page) + list(second_page),
+            list(Post.objects.order_by('-pub_date', '-pk'))
+        )
+        response = self.guest_client.get(
+            url + f'?cursor={second_page.previous_cursor}'
+        )
+        self.assertEqual(list(response.context['page_obj']), list(first_page))
+
+    @override_settings(POSTS_FANOUT_FOLLOWERS_LIMIT=1)
+    def test_follow_cursor_merges_popular_authors(self):
+        """Лента подписок с популярным автором листается курсором
+         без пропусков и повторов, в том числе постов, которые
+         попали в ленту до того, как автор стал популярным."""
+        popular = User.objects.create_user(username='Popular')
+        Follow.objects.create(user=self.user, author=popular)
+        for i in range(3):
+            Post.objects.create(text=f'Разложенный {i}', author=popular)
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=popular)
+        for i in range(2):
+            Post.objects.create(text=f'Подтянутый {i}', author=popular)
+        url = reverse('posts:follow_index')
+        first_page = self.authorized_client.get(url).context['page_obj']
+        self.assertTrue(first_page.is_cursor)
+        self.assertEqual(len(first_page), 10)
+        response = self.authorized_client.get(
+            url + f'?cursor={first_page.next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            list(first_page) + list(second_page),
+            list(Post.objects.filter(
+                author__in=[PaginatorViewsTest.user, popular]
+            ).order_by('-pub_date', '-pk'))
+        )
+        response = self.authorized_client.get(
+            url + f'?cursor={second_page.previous_cursor}'
+        )
+        self.assertEqual(list(response.context['page_obj']), list(first_page))
+
+    def test_cursor_invalid_returns_first_page(self):
+        """Ошибочный курсор возвращает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index') + '?cursor=broken'
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(Post.objects.order_by('-pub_date', '-pk')[:10])
+        )
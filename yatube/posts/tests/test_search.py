@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from ..models import Post
+from ..stemmer import stem
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Кошки гуляли по крышам'
+        )
+        cls.dogs = Post.objects.create(
+            author=cls.user, text='Собака лаяла на кошку'
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query}
+        )
+        return set(response.context['page_obj'])
+
+    def test_stemmer(self):
+        """Стеммер приводит формы слова к одной основе."""
+        words = {
+            'котами': 'кот',
+            'важнейшими': 'важн',
+            'бесконечностью': 'бесконечн',
+            'ёлки': 'елк',
+        }
+        for word, expected in words.items():
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), expected)
+
+    def test_search_finds_word_forms(self):
+        """Поиск находит посты с другой формой слова."""
+        self.assertEqual(
+            self.search('кошкам'), {SearchTests.cats, SearchTests.dogs}
+        )
+        self.assertEqual(self.search('собаки кошки'), {SearchTests.dogs})
+        self.assertEqual(self.search(''), set())
+
+    def test_search_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        post = SearchTests.dogs
+        post.text = 'Попугай'
+        post.save()
+        self.assertEqual(self.search('собака'), set())
+        self.assertEqual(self.search('попугаи'), {post})
+        post.delete()
+        self.assertEqual(self.search('попугай'), set())
+
+    @override_settings(
+        POSTS_SEARCH_BACKEND='posts.search.DatabaseSearchBackend'
+    )
+    def test_database_backend(self):
+        """Запасной бэкенд ищет по вхождению слов."""
+        self.assertEqual(self.search('Собака кошку'), {SearchTests.dogs})
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по поисковому индексу."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собаки'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [SearchTests.dogs]
+        )
@@ -0,0 +1,123 @@
+import json
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.asgi import ENVIRON_KEY
+from core.broker import broker
+from ..models import Follow, Post
+
+User = get_user_model()
+
+
+@override_settings(STREAM_HEARTBEAT=0.01, STREAM_TIMEOUT=1)
+class NewPostsStreamTests(TransactionTestCase):
+    """Публикация идёт после фиксации транзакции, поэтому тесты
+    выполняются без общей транзакции TestCase."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        self.stranger = User.objects.create_user(username='Stranger')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(author=self.author, text='Старый')
+        self.client = Client(**{ENVIRON_KEY: True})
+        self.client.force_login(self.reader)
+
+    def connect(self, url, params=None):
+        """Подключается к потоку и ждёт его начала: посты, созданные
+        после этого, приходят событиями."""
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.stream = iter(response.streaming_content)
+        self.assertTrue(next(self.stream).startswith(b'retry: '))
+        return response
+
+    def events(self, count):
+        """Следующие count событий new_posts, пропуская служебные."""
+        events = []
+        for chunk in self.stream:
+            chunk = chunk.decode()
+            if chunk.startswith('event: new_posts'):
+                events.append(json.loads(chunk.split('data: ')[1]))
+                if len(events) == count:
+                    break
+        return events
+
+    def test_index_stream(self):
+        """Новые посты приходят в поток главной, уже учтённые
+        не повторяются."""
+        response = self.connect(
+            reverse('posts:index_stream'), {'after': self.post.pk}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        try:
+            Post.objects.create(author=self.stranger, text='Новый')
+            Post.objects.create(author=self.author, text='Ещё новый')
+            self.assertEqual(
+                self.events(2), [{'count': 1}, {'count': 2}]
+            )
+        finally:
+            response.close()
+        self.assertEqual(broker.subscribers, 0)
+
+    def test_follow_stream(self):
+        """Лента подписок считает только посты избранных авторов,
+        включая появившиеся до подключения."""
+        older = self.post.pk - 1
+        response = self.connect(
+            reverse('posts:follow_stream'), {'after': older}
+        )
+        try:
+            Post.objects.create(author=self.stranger, text='Чужой')
+            Post.objects.create(author=self.author, text='Свой')
+            self.assertEqual(
+                self.events(2), [{'count': 1}, {'count': 2}]
+            )
+        finally:
+            response.close()
+
+    def test_follow_stream_requires_login(self):
+        response = Client(**{ENVIRON_KEY: True}).get(
+            reverse('posts:follow_stream')
+        )
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_no_streams_under_wsgi(self):
+        """Под WSGI страница не подключается к потоку, а поток отвечает
+        204, чтобы браузер не переподключался."""
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:index_stream'))
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(broker.subscribers, 0)
+        self.assertNotContains(
+            client.get(reverse('posts:index')), 'EventSource'
+        )
+        self.assertContains(
+            self.client.get(reverse('posts:index')), 'EventSource'
+        )
+
+    @override_settings(STREAM_MAX_PER_CLIENT=1)
+    def test_connection_limit(self):
+        """Закрытое соединение освобождает место."""
+        url = reverse('posts:index_stream')
+        response = self.client.get(url)
+        refused = self.client.get(url)
+        self.assertEqual(refused.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', refused)
+        response.close()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response.close()
+
+    def test_stream_ends(self):
+        """Поток закрывается по истечении STREAM_TIMEOUT."""
+        with override_settings(STREAM_TIMEOUT=0.05):
+            response = self.client.get(reverse('posts:index_stream'))
+            content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.startswith('retry: '))
+        self.assertIn(': ping', content)
+        self.assertEqual(broker.subscribers, 0)
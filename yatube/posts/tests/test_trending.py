@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import trending
+from ..models import Follow, Post, TrendingScore
+
+User = get_user_model()
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='Reader')
+        self.author = User.objects.create_user(username='Author')
+        self.other = User.objects.create_user(username='Other')
+
+    def ranking(self):
+        return list(trending.get_trending())
+
+    def test_score_arithmetic(self):
+        """Логарифмы складываются как веса, вес затухает вдвое
+        за период полураспада."""
+        now = timezone.now()
+        half_life = timedelta(seconds=settings.POSTS_TRENDING_HALF_LIFE)
+        one = trending.contribution(1, now)
+        self.assertAlmostEqual(
+            trending.add(one, one), trending.contribution(2, now)
+        )
+        self.assertAlmostEqual(
+            trending.contribution(1, now + half_life),
+            trending.contribution(2, now),
+        )
+
+    def test_comments_raise_post(self):
+        """Обсуждаемый пост поднимается выше более нового."""
+        discussed = Post.objects.create(author=self.author, text='Старый')
+        fresh = Post.objects.create(author=self.other, text='Новый')
+        self.assertEqual(self.ranking(), [fresh, discussed])
+        discussed.comments.create(author=self.reader, text='Интересно')
+        self.assertEqual(self.ranking(), [discussed, fresh])
+
+    def test_followers_raise_posts(self):
+        """Новый подписчик поднимает посты автора."""
+        followed = Post.objects.create(author=self.author, text='Первый')
+        other = Post.objects.create(author=self.other, text='Второй')
+        self.assertEqual(self.ranking(), [other, followed])
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.ranking(), [followed, other])
+
+    def test_window(self):
+        """Старые посты не попадают в рейтинг и удаляются из него."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=trending.cutoff() - timedelta(hours=1)
+        )
+        self.assertEqual(trending.prune(), 1)
+        self.assertEqual(self.ranking(), [])
+        post.refresh_from_db()
+        post.comments.create(author=self.reader, text='Поздно')
+        self.assertFalse(TrendingScore.objects.exists())
+
+    def test_rebuild_matches_incremental(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        for _ in range(3):
+            post.comments.create(author=self.reader, text='Комментарий')
+        incremental = TrendingScore.objects.get(post=post).score
+        self.assertEqual(trending.rebuild(), 1)
+        self.assertAlmostEqual(
+            TrendingScore.objects.get(post=post).score, incremental
+        )
+
+    def test_popular_page(self):
+        quiet = Post.objects.create(author=self.other, text='Тихий')
+        discussed = Post.objects.create(author=self.author, text='Громкий')
+        discussed.comments.create(author=self.reader, text='Да')
+        response = self.client.get(reverse('posts:popular'))
+        self.assertEqual(list(response.context['posts']), [discussed, quiet])
@@ -5,6 +5,7 @@ from django.test import TestCase, Client
 from django.core.cache import cache
 from django.urls import reverse
 
+from ..caching import page_cache_stats, reset_page_cache_stats
 from ..models import Follow, Post, Group
 
 User = get_user_model()
@@ -138,13 +139,28 @@ class PostURLTests(TestCase):
         )
         response = self.guest_client.get(reverse('posts:index'))
         cache_check = response.content
-        post.delete()
+        # Изменение в обход сигналов не сбрасывает кэш
+        Post.objects.filter(pk=post.pk).update(text='Изменённый текст')
         response = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response.content, cache_check)
-        cache.clear()
+        # Удаление поста сбрасывает кэш
+        post.delete()
         response = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, cache_check)
 
+    def test_index_page_cache_vary_on_page(self):
+        """Кэш главной страницы хранится отдельно для каждой страницы"""
+        cache.clear()
+        Post.objects.bulk_create(
+            Post(text=f'Пост №{i}', author=PostURLTests.user)
+            for i in range(12)
+        )
+        response = self.guest_client.get(reverse('posts:index'))
+        second_page = self.guest_client.get(
+            reverse('posts:index') + '?page=2'
+        )
+        self.assertNotEqual(response.content, second_page.content)
+
     def test_follow_page_cache(self):
         """Страница follow кэшируется"""
         cache.clear()
@@ -158,13 +174,78 @@ class PostURLTests(TestCase):
         )
         response = self.authorized_client.get(reverse('posts:follow_index'))
         cache_check = response.content
-        post.delete()
+        # Изменение в обход сигналов не сбрасывает кэш
+        Post.objects.filter(pk=post.pk).update(text='Изменённый текст')
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertEqual(response.content, cache_check)
-        cache.clear()
+        # Отписка сбрасывает кэш ленты подписок
+        Follow.objects.filter(user=PostURLTests.user).delete()
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertNotEqual(response.content, cache_check)
 
+    def page_cache_state(self, url):
+        return self.guest_client.get(url).get('X-Page-Cache')
+
+    def test_anonymous_page_cache(self):
+        """Страницы кэшируются целиком только для анонимных
+         посетителей."""
+        cache.clear()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'NoName'}),
+            reverse(
+                'posts:post_detail', kwargs={'post_id': PostURLTests.post.pk}
+            ),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.page_cache_state(url), 'miss')
+                self.assertEqual(self.page_cache_state(url), 'hit')
+                response = self.authorized_client.get(url)
+                self.assertNotIn('X-Page-Cache', response)
+
+    def test_page_cache_purge(self):
+        """Изменение поста и комментарий к нему сбрасывают страницы
+         поста, автора и групп, но не чужие."""
+        cache.clear()
+        post = PostURLTests.post
+        new_group = Group.objects.create(
+            title='Новая группа', slug='new-slug', description='-'
+        )
+        post.group = PostURLTests.group
+        post.save()
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        profile = reverse('posts:profile', kwargs={'username': 'NoName'})
+        old_group = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        group = reverse('posts:group_list', kwargs={'slug': 'new-slug'})
+        other = reverse('posts:profile', kwargs={'username': 'Another'})
+        urls = (detail, profile, old_group, group, other)
+        for url in urls:
+            self.page_cache_state(url)
+        post.group = new_group
+        post.save()
+        for url in urls[:-1]:
+            with self.subTest(url=url):
+                self.assertEqual(self.page_cache_state(url), 'miss')
+        self.assertEqual(self.page_cache_state(other), 'hit')
+        post.comments.create(author=PostURLTests.another_user, text='-')
+        for url in (detail, profile, group):
+            with self.subTest(url=url):
+                self.assertEqual(self.page_cache_state(url), 'miss')
+        self.assertEqual(self.page_cache_state(old_group), 'hit')
+        self.assertEqual(self.page_cache_state(other), 'hit')
+
+    def test_page_cache_stats(self):
+        """Попадания и промахи кэша страниц считаются."""
+        cache.clear()
+        reset_page_cache_stats()
+        for _ in range(4):
+            self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(
+            page_cache_stats(), {'hits': 3, 'misses': 1, 'hit_ratio': 0.75}
+        )
+
     def test_follow_and_unfollow_url(self):
         """Авторизованный пользователь может подписываться на
          других пользователей и удалять их из подписок."""
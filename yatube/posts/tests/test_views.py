@@ -1,16 +1,28 @@
+import os
 import time
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django import forms
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 from ..forms import PostForm, CommentForm
-from ..models import Follow, Post, Group
+from .. import renditions, thumbnails
+from ..models import Follow, Post, Group, TimelineEntry, UserStats
+from ..paginators import CursorPaginator
+from ..timeline import FEED_ORDERING, get_feed
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
@@ -177,7 +189,7 @@ class PostViewsTests(TestCase):
         # Проверка поля 'post'
         self.assertEqual(post_object, PostViewsTests.post)
         # Проверка поля 'comments'
-        self.assertEqual(comments.last(), comment)
+        self.assertEqual(list(comments), [comment])
 
     def test_post_edit_show_correct_context(self):
         """Шаблон post_edit сформирован с правильным контекстом."""
@@ -310,3 +322,472 @@ class PostViewsTests(TestCase):
             author=PostViewsTests.user_1
         ).exists()
         self.assertFalse(follow_exists)
+
+    def test_timeline_fan_out_and_prune(self):
+        """Пост раскладывается по лентам подписчиков, а после отписки
+         убирается из ленты."""
+        Follow.objects.create(
+            user=PostViewsTests.user_0,
+            author=PostViewsTests.user_1
+        )
+        new_post = Post.objects.create(
+            author=PostViewsTests.user_1,
+            text='Новый пост',
+        )
+        timeline = TimelineEntry.objects.filter(user=PostViewsTests.user_0)
+        # Проверка заполнения ленты при подписке и публикации
+        self.assertEqual(
+            set(timeline.values_list('post', flat=True)),
+            {PostViewsTests.post_in_group.pk, new_post.pk}
+        )
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': PostViewsTests.user_1.username}
+        ))
+        # Проверка очистки ленты после отписки
+        self.assertFalse(timeline.exists())
+
+    @override_settings(POSTS_FANOUT_FOLLOWERS_LIMIT=0)
+    def test_timeline_pull_popular_author(self):
+        """Посты популярного автора не раскладываются, но попадают
+         в ленту подписок."""
+        Follow.objects.create(
+            user=PostViewsTests.user_0,
+            author=PostViewsTests.user_1
+        )
+        new_post = Post.objects.create(
+            author=PostViewsTests.user_1,
+            text='Новый пост',
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [new_post, PostViewsTests.post_in_group]
+        )
+
+    @override_settings(
+        POSTS_FANOUT_FOLLOWERS_LIMIT=1, POSTS_FANOUT_RESUME_LIMIT=1
+    )
+    def test_timeline_author_no_longer_popular(self):
+        """Посты, опубликованные, пока автор был популярным, остаются
+         в лентах, когда подписчиков становится меньше, а раскладку
+         возобновляет команда resume_fanout, а не отписка."""
+        Follow.objects.create(
+            user=PostViewsTests.user_0,
+            author=PostViewsTests.user_1
+        )
+        follower = User.objects.create_user(username='Follower')
+        Follow.objects.create(user=follower, author=PostViewsTests.user_1)
+        pulled = Post.objects.create(
+            author=PostViewsTests.user_1,
+            text='Пост популярного автора',
+        )
+        timeline = TimelineEntry.objects.filter(user=PostViewsTests.user_0)
+        self.assertFalse(timeline.filter(post=pulled).exists())
+        Follow.objects.filter(user=follower).delete()
+        self.assertFalse(timeline.filter(post=pulled).exists())
+        url = reverse('posts:follow_index')
+        expected = [pulled, PostViewsTests.post_in_group]
+        response = self.authorized_client.get(url)
+        self.assertEqual(list(response.context['page_obj']), expected)
+        call_command('resume_fanout', stdout=StringIO())
+        self.assertTrue(timeline.filter(post=pulled).exists())
+        self.assertFalse(
+            UserStats.objects.get(user=PostViewsTests.user_1).pulled
+        )
+        response = self.authorized_client.get(url)
+        self.assertEqual(list(response.context['page_obj']), expected)
+
+    @override_settings(
+        POSTS_FANOUT_FOLLOWERS_LIMIT=1, POSTS_FANOUT_RESUME_LIMIT=0
+    )
+    def test_timeline_fanout_hysteresis(self):
+        """Автор, опустившийся до предела раскладки, но не до предела
+         её возобновления, остаётся популярным."""
+        Follow.objects.create(
+            user=PostViewsTests.user_0,
+            author=PostViewsTests.user_1
+        )
+        follower = User.objects.create_user(username='Follower')
+        Follow.objects.create(user=follower, author=PostViewsTests.user_1)
+        Follow.objects.filter(user=follower).delete()
+        call_command('resume_fanout', stdout=StringIO())
+        post = Post.objects.create(
+            author=PostViewsTests.user_1,
+            text='Пост популярного автора',
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    @override_settings(
+        POSTS_FANOUT_FOLLOWERS_LIMIT=0, POSTS_FEED_PULL_SOURCES=1
+    )
+    def test_timeline_many_popular_authors(self):
+        """Посты многих популярных авторов читаются одним запросом."""
+        authors = [
+            User.objects.create_user(username=f'Popular{i}')
+            for i in range(3)
+        ]
+        for author in authors:
+            Follow.objects.create(user=PostViewsTests.user_0, author=author)
+            Post.objects.create(author=author, text='Пост')
+        self.assertEqual(len(get_feed(PostViewsTests.user_0)), 2)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(Post.objects.filter(author__in=authors))
+        )
+
+    def test_feeds_query_count_does_not_depend_on_page_size(self):
+        """Количество запросов к базе на странице ленты не зависит
+         от количества постов на странице."""
+        authors = [
+            User.objects.create_user(username=f'Author{i}') for i in range(5)
+        ]
+        groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='-'
+            )
+            for i in range(5)
+        ]
+        for author in authors:
+            Follow.objects.create(user=PostViewsTests.user_0, author=author)
+            for group in groups:
+                Post.objects.create(author=author, group=group, text='Пост')
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:follow_index'),
+            reverse('posts:group_list', kwargs={'slug': 'group-0'}),
+            reverse('posts:profile', kwargs={'username': 'Author0'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                queries = []
+                for count in (1, 10):
+                    cache.clear()
+                    with mock.patch('posts.views.COUNT', count):
+                        with CaptureQueriesContext(connection) as context:
+                            self.authorized_client.get(url)
+                    queries.append(len(context))
+                self.assertEqual(queries[0], queries[1])
+
+    def test_post_detail_comments_pagination(self):
+        """Комментарии выводятся страницами, следующая страница
+         подгружается фрагментом по курсору."""
+        post = Post.objects.create(author=PostViewsTests.user_0, text='Пост')
+        for i in range(5):
+            post.comments.create(
+                author=PostViewsTests.user_1, text=f'Комментарий {i}'
+            )
+        expected = list(post.comments.order_by('-created', '-pk'))
+        with mock.patch('posts.views.COMMENTS_COUNT', 3):
+            response = self.guest_client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': post.pk}
+            ))
+            comments = response.context['comments']
+            self.assertEqual(list(comments), expected[:3])
+            self.assertTrue(comments.has_next())
+            fragment_url = reverse(
+                'posts:post_comments', kwargs={'post_id': post.pk}
+            )
+            self.assertContains(response, fragment_url)
+            response = self.guest_client.get(
+                fragment_url, {'cursor': comments.next_cursor}
+            )
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertEqual(list(response.context['comments']), expected[3:])
+        self.assertNotContains(response, 'data-fragment')
+
+    def test_comments_query_count_does_not_depend_on_page_size(self):
+        """Авторы комментариев выбираются тем же запросом."""
+        post = Post.objects.create(author=PostViewsTests.user_0, text='Пост')
+        for i in range(10):
+            author = User.objects.create_user(username=f'Commenter{i}')
+            post.comments.create(author=author, text='Комментарий')
+        url = reverse('posts:post_comments', kwargs={'post_id': post.pk})
+        queries = []
+        for count in (1, 10):
+            with mock.patch('posts.views.COMMENTS_COUNT', count):
+                with CaptureQueriesContext(connection) as context:
+                    self.guest_client.get(url)
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_conditional_get(self):
+        """Страницы отдают 304, пока не изменились их посты, комментарии
+         и подписки пользователя."""
+        post = PostViewsTests.post
+        urls = {
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}): post,
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}):
+                PostViewsTests.post_in_group,
+            reverse('posts:profile', kwargs={'username': 'NoName'}): post,
+        }
+        for url, post in urls.items():
+            with self.subTest(url=url):
+                etag = self.authorized_client.get(url)['ETag']
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 304)
+                # Другому пользователю страница показывается иначе
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                post.comments.create(
+                    author=PostViewsTests.user_1, text='Комментарий'
+                )
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                Follow.objects.create(
+                    user=PostViewsTests.user_0, author=PostViewsTests.user_1
+                )
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                Follow.objects.all().delete()
+
+    def test_anonymous_conditional_get(self):
+        """Анонимному посетителю ETag не зависит от cookie CSRF,
+        а изменения других страниц его не меняют."""
+        post = PostViewsTests.post
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        response = self.guest_client.get(url)
+        self.assertNotIn('csrftoken', response.cookies)
+        etag = response['ETag']
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        PostViewsTests.post_in_group.comments.create(
+            author=PostViewsTests.user_1, text='Комментарий'
+        )
+        Post.objects.create(author=PostViewsTests.user_1, text='Другой')
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_conditional_get_related_changes(self):
+        """ETag страницы поста меняется, когда готова миниатюра, у автора
+        появляется пост и группу переименовывают."""
+        post = PostViewsTests.post_in_group
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, 'cache'), True)
+        cache.clear()
+
+        def rename_group():
+            group = Group.objects.get(pk=post.group_id)
+            group.title = 'Новое название'
+            group.save()
+
+        changes = {
+            'thumbnail': lambda: thumbnails.generate(post.image.name),
+            'author': lambda: Post.objects.create(
+                author=post.author, text='Ещё пост'
+            ),
+            'group': rename_group,
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                etag = self.guest_client.get(url)['ETag']
+                change()
+                response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_if_modified_since(self):
+        """If-Modified-Since сравнивается со временем последнего
+         изменения содержимого."""
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': PostViewsTests.post.pk}
+        )
+        last_modified = self.guest_client.get(url)['Last-Modified']
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+        later = time.time() + 5
+        with mock.patch('posts.caching.time.time', return_value=later):
+            PostViewsTests.post.comments.create(
+                author=PostViewsTests.user_1, text='Комментарий'
+            )
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_thumbnail_placeholder(self):
+        """Пока миниатюра не создана, вместо неё выводится заглушка."""
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': PostViewsTests.post.pk}
+        )
+        # Миниатюры могли остаться от других тестов
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, 'cache'), True)
+        cache.clear()
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'img/placeholder.svg')
+        thumbnails.generate(PostViewsTests.post.image.name)
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'img/placeholder.svg')
+        self.assertContains(response, '/media/cache/')
+
+    def test_feed_thumbnail_placeholder_purged(self):
+        """Готовая миниатюра сбрасывает закэшированный фрагмент ленты
+        с заглушкой, в том числе когда её создал пул процессов."""
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, 'cache'), True)
+        cache.clear()
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'img/placeholder.svg')
+        thumbnails.generate(PostViewsTests.post.image.name)
+        thumbnails.generate(PostViewsTests.post_in_group.image.name)
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, 'img/placeholder.svg')
+        # Колбэк задачи пула сбрасывает версию в основном процессе
+        cache_key = response.context['cache_key']
+        future = mock.Mock(**{'exception.return_value': None})
+        with mock.patch('posts.thumbnails.connection'):
+            thumbnails._done(PostViewsTests.post.image.name)(future)
+        response = self.authorized_client.get(url)
+        self.assertNotEqual(response.context['cache_key'], cache_key)
+
+    def test_build_renditions_command(self):
+        """Команда build_renditions создаёт адаптивные копии картинок,
+         и карточка поста выводит их через srcset."""
+        name = PostViewsTests.post.image.name
+        call_command('build_renditions', workers=0, stdout=StringIO())
+        for width in renditions.WIDTHS:
+            for extension in renditions.FORMATS:
+                with self.subTest(width=width, extension=extension):
+                    self.assertTrue(os.path.exists(os.path.join(
+                        TEMP_MEDIA_ROOT,
+                        renditions.rendition_name(name, width, extension)
+                    )))
+        thumbnails.generate(name)
+        response = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': PostViewsTests.post.pk}
+        ))
+        self.assertContains(
+            response, renditions.rendition_name(name, 480, 'jpg')
+        )
+
+    def test_renditions_do_not_touch_originals(self):
+        """Копии картинок с одинаковым именем, но разным расширением
+         не совпадают, а пересоздание копий не удаляет оригиналы."""
+        originals = [
+            default_storage.save(
+                f'posts/same{extension}',
+                ContentFile(PostViewsTests.small_gif),
+            )
+            for extension in ('.gif', '.png')
+        ]
+        # Оригинал, имя которого похоже на имя копии
+        lookalike = default_storage.save(
+            originals[0].replace('.gif', '_480w.jpg'),
+            ContentFile(PostViewsTests.small_gif),
+        )
+        for name in originals:
+            renditions.create(name)
+            renditions.create(name, force=True)
+        names = {
+            renditions.rendition_name(name, 480, 'jpg') for name in originals
+        }
+        self.assertEqual(len(names), 2)
+        for name in [*originals, lookalike, *names]:
+            with self.subTest(name=name):
+                self.assertTrue(default_storage.exists(name))
+        self.assertTrue(all(
+            name.startswith(renditions.PREFIX) for name in names
+        ))
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for _ in range(3):
+            cls.post = Post.objects.create(
+                author=cls.author, group=cls.group, text='Пост'
+            )
+            cls.post.comments.create(author=cls.reader, text='Комментарий')
+
+    def setUp(self):
+        self.client.force_login(QueryPlanTests.reader)
+        cache.clear()
+
+    def plans(self, url):
+        """Планы запросов представления, которые сортируют записи."""
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if 'ORDER BY' not in sql or '"posts_' not in sql:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans[sql] = [row[-1] for row in cursor.fetchall()]
+        return plans
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент и комментариев читают индекс и не сортируют
+         записи во временном B-дереве."""
+        post_id = QueryPlanTests.post.pk
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?cursor=',
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:group_list', kwargs={'slug': 'group'}) + '?cursor=',
+            reverse('posts:profile', kwargs={'username': 'Author'}),
+            reverse('posts:profile', kwargs={'username': 'Author'})
+            + '?cursor=',
+            reverse('posts:post_detail', kwargs={'post_id': post_id}),
+            reverse('posts:post_comments', kwargs={'post_id': post_id}),
+            reverse('posts:follow_index'),
+            reverse('posts:follow_index') + '?cursor=',
+            reverse('posts:follow_index') + '?cursor=' + self.feed_cursor(),
+            reverse('posts:api_follow_index'),
+            reverse('posts:popular'),
+            reverse('posts:group_index'),
+        )
+        self.assert_use_indexes(urls)
+
+    @override_settings(POSTS_FANOUT_FOLLOWERS_LIMIT=0)
+    def test_pull_feed_queries_use_indexes(self):
+        """Посты популярных авторов читаются по индексу автора,
+         а не сортируются вместе с лентой."""
+        cursor = self.feed_cursor()
+        urls = (
+            reverse('posts:follow_index'),
+            reverse('posts:follow_index') + '?cursor=' + cursor,
+            reverse('posts:api_follow_index') + '?cursor=' + cursor,
+        )
+        self.assert_use_indexes(urls)
+
+    def feed_cursor(self):
+        """Курсор ленты подписок на следующие посты после первого."""
+        source = get_feed(QueryPlanTests.reader)[0]
+        paginator = CursorPaginator(source, 1, FEED_ORDERING)
+        return paginator.page().next_cursor
+
+    def assert_use_indexes(self, urls):
+        for url in urls:
+            plans = self.plans(url)
+            self.assertTrue(plans, url)
+            for sql, plan in plans.items():
+                with self.subTest(url=url, sql=sql):
+                    self.assertTrue(
+                        any('INDEX' in step for step in plan), plan
+                    )
+                    self.assertFalse(
+                        any('TEMP B-TREE' in step for step in plan), plan
+                    )
@@ -0,0 +1,172 @@
+"""Фоновое создание миниатюр картинок постов.
+
+Миниатюры создаются пулом процессов (Pillow загружает процессор, потоки
+тут не помогут) сразу после сохранения поста. Пока миниатюры нет,
+шаблоны показывают заглушку вместо синхронного создания в запросе.
+Когда миниатюра и копии готовы, основной процесс сбрасывает ленты
+и страницы постов с этой картинкой: иначе заглушка осталась бы
+в закэшированных фрагментах и в валидаторах страниц.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import KVStoreBase
+
+from . import renditions
+from .caching import FEED_VERSION_KEY, bump_post_pages, bump_version
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Миниатюра карточки поста, как в шаблонах includes/post_card.html
+# и posts/post_detail.html
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+PENDING_KEY = 'posts:thumbnail:pending:{}'
+PENDING_TIMEOUT = 60  # Через минуту незавершённая задача ставится снова
+
+_executor = None
+
+
+class PendingThumbnailBackend(ThumbnailBackend):
+    def get_thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, который вернул бы get_thumbnail,
+        без создания самой миниатюры."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+backend = PendingThumbnailBackend()
+
+
+class WorkerKVStore(KVStoreBase):
+    """Хранилище ключей sorl в памяти воркера.
+
+    Воркеры только пишут файлы: запись о миниатюре сделает основной
+    процесс при первом показе, поэтому воркеры не ждут запись в базу.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._data = {}
+
+    def _get_raw(self, key):
+        return self._data.get(key)
+
+    def _set_raw(self, key, value):
+        self._data[key] = value
+
+    def _delete_raw(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def _find_keys_raw(self, prefix):
+        return [key for key in self._data if key.startswith(prefix)]
+
+
+def is_ready(image):
+    thumbnail = backend.get_thumbnail_file(
+        image, CARD_GEOMETRY, **CARD_OPTIONS
+    )
+    return bool(default.kvstore.get(thumbnail)) or thumbnail.exists()
+
+
+def init_worker():
+    """Готовит процесс пула: настраивает Django и хранилище ключей."""
+    import django
+
+    settings.THUMBNAIL_KVSTORE = 'posts.thumbnails.WorkerKVStore'
+    django.setup()
+
+
+def create(name):
+    """Создаёт миниатюру и копии картинки; выполняется и в воркерах."""
+    get_thumbnail(name, CARD_GEOMETRY, **CARD_OPTIONS)
+    renditions.create(name)
+
+
+def images_changed(names):
+    """Сбрасывает ленты и страницы постов с картинками из names."""
+    bump_version(FEED_VERSION_KEY)
+    posts = Post.objects.filter(image__in=names).values_list(
+        'pk', 'author__username', 'group__slug'
+    )
+    for post_id, username, slug in posts:
+        bump_post_pages(post_id, username, [slug] if slug else [])
+
+
+def generate(name):
+    create(name)
+    images_changed([name])
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+        )
+    return _executor
+
+
+def _done(name):
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            logger.error('Не удалось создать миниатюру: %s', error)
+            return
+        try:
+            images_changed([name])
+        finally:
+            # Колбэк выполняется в служебном потоке пула, соединение
+            # которого больше никто не закроет
+            connection.close()
+    return callback
+
+
+def _submit(name):
+    global _executor
+    if not settings.POSTS_THUMBNAIL_WORKERS:
+        generate(name)
+        return
+    try:
+        future = _get_executor().submit(create, name)
+    except BrokenProcessPool:
+        # Пул пересоздастся при следующей задаче, а эту повторит шаблон
+        logger.exception('Пул создания миниатюр остановлен')
+        _executor = None
+        cache.delete(PENDING_KEY.format(name))
+        return
+    future.add_done_callback(_done(name))
+
+
+def schedule(image):
+    """Ставит создание миниатюры в очередь после фиксации транзакции."""
+    if not image:
+        return
+    if not cache.add(PENDING_KEY.format(image.name), True, PENDING_TIMEOUT):
+        return
+    name = image.name
+    transaction.on_commit(lambda: _submit(name))
@@ -0,0 +1,216 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+При публикации пост раскладывается по лентам подписчиков автора,
+поэтому `follow_index` читает готовую ленту вместо соединения постов
+с таблицей подписок. Посты авторов, у которых подписчиков больше
+`POSTS_FANOUT_FOLLOWERS_LIMIT`, не раскладываются, а подтягиваются
+при чтении ленты; такой автор отмечается в `UserStats.pulled`. Отметку
+снимает команда resume_fanout, когда подписчиков становится не больше
+`POSTS_FANOUT_RESUME_LIMIT`: она же раскладывает последние посты автора
+по лентам задним числом, иначе посты, опубликованные без раскладки,
+пропали бы из лент. Запрос подписки или отписки этой работы не делает.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+BATCH_SIZE = 500  # Размер пачки при массовой вставке записей ленты
+FEED_ORDERING = ('-feed_date', '-feed_post')  # Ключ ленты подписок
+
+
+def _pulled():
+    # Счётчики могли пересчитать в обход сигналов, поэтому учитывается
+    # и число подписчиков
+    return Q(pulled=True) | Q(
+        followers_count__gt=settings.POSTS_FANOUT_FOLLOWERS_LIMIT
+    )
+
+
+def is_pull_author(author):
+    """Посты автора читаются из таблицы постов, а не раскладываются."""
+    return UserStats.objects.filter(_pulled(), user=author).exists()
+
+
+def mark_pulled(author_ids):
+    """Отмечает авторов, число подписчиков которых превысило предел
+    раскладки."""
+    UserStats.objects.filter(
+        user_id__in=author_ids,
+        pulled=False,
+        followers_count__gt=settings.POSTS_FANOUT_FOLLOWERS_LIMIT,
+    ).update(pulled=True)
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    if is_pull_author(post.author):
+        return
+    followers = Follow.objects.filter(author=post.author).values_list(
+        'user_id', flat=True
+    )
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_many(posts):
+    """Как fan_out для пачки постов: подписчики авторов читаются одним
+    запросом, записи лент вставляются одним bulk_create."""
+    authors = {post.author_id for post in posts}
+    pulled = UserStats.objects.filter(
+        _pulled(), user_id__in=authors
+    ).values_list('user_id', flat=True)
+    followers = defaultdict(list)
+    for author_id, user_id in Follow.objects.filter(
+        author_id__in=authors.difference(pulled)
+    ).values_list('author_id', 'user_id').iterator():
+        followers[author_id].append(user_id)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for post in posts
+            for user_id in followers[post.author_id]
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    if is_pull_author(follow.author):
+        return
+    posts = Post.objects.filter(author=follow.author).values_list(
+        'pk', 'pub_date'
+    )[:settings.POSTS_TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user=follow.user, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_many(follows):
+    """Как backfill для пачки подписок: последние посты читаются
+    по одному запросу на автора, записи лент вставляются одним
+    bulk_create."""
+    authors = {follow.author_id for follow in follows}
+    mark_pulled(authors)
+    pulled = UserStats.objects.filter(
+        _pulled(), user_id__in=authors
+    ).values_list('user_id', flat=True)
+    latest = {
+        author_id: list(Post.objects.filter(author_id=author_id).values_list(
+            'pk', 'pub_date'
+        )[:settings.POSTS_TIMELINE_BACKFILL])
+        for author_id in authors.difference(pulled)
+    }
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=follow.user_id, post_id=pk, pub_date=date)
+            for follow in follows
+            for pk, date in latest.get(follow.author_id, ())
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def resume_fanout():
+    """Возобновляет раскладку постов авторов, у которых подписчиков
+    стало не больше POSTS_FANOUT_RESUME_LIMIT, и добавляет в ленты
+    их подписчиков по POSTS_TIMELINE_REPUSH последних постов.
+    Возвращает число таких авторов."""
+    authors = list(UserStats.objects.filter(
+        pulled=True,
+        followers_count__lte=settings.POSTS_FANOUT_RESUME_LIMIT,
+    ).values_list('user_id', flat=True))
+    for author_id in authors:
+        # Отметка снимается до раскладки: посты, опубликованные во время
+        # неё, разложит fan_out, а повторы отбросит ignore_conflicts
+        if not UserStats.objects.filter(
+            user_id=author_id, pulled=True,
+            followers_count__lte=settings.POSTS_FANOUT_RESUME_LIMIT,
+        ).update(pulled=False):
+            continue
+        posts = list(Post.objects.filter(author_id=author_id).values_list(
+            'pk', 'pub_date'
+        )[:settings.POSTS_TIMELINE_REPUSH])
+        followers = Follow.objects.filter(author_id=author_id).values_list(
+            'user_id', flat=True
+        )
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for user_id in followers.iterator()
+                for pk, pub_date in posts
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    return len(authors)
+
+
+def prune(follow):
+    """Убирает из ленты подписчика посты автора, от которого он
+    отписался."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+
+
+def rebuild():
+    """Перестраивает все ленты по подпискам, например после массовой
+    загрузки записей в обход сигналов."""
+    TimelineEntry.objects.all().delete()
+    for follow in Follow.objects.select_related('author', 'user').iterator():
+        backfill(follow)
+
+
+def pull_authors(user):
+    """Авторы из подписок пользователя, чьи посты не раскладываются."""
+    return UserStats.objects.filter(
+        _pulled(), user__following__user=user,
+    ).values_list('user', flat=True)
+
+
+def get_feed(user):
+    """Источники ленты подписок: материализованная часть и посты
+    популярных авторов.
+
+    Все источники отдают ключ ленты (feed_date, feed_post) и читаются
+    в порядке FEED_ORDERING: записи ленты - по индексу
+    timeline_user_date_post_idx, посты популярного автора - по
+    post_author_date_idx. Страница ленты собирается слиянием их страниц
+    (см. MergedCursorPaginator), поэтому посты ленты не сортируются
+    в базе. Чтобы число запросов не росло с числом подписок, отдельным
+    источником читаются только POSTS_FEED_PULL_SOURCES популярных
+    авторов, если их больше - посты всех одним запросом с сортировкой.
+    """
+    sources = [
+        Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_post=F('timeline_entries__post'),
+        )
+    ]
+    authors = list(pull_authors(user))
+    if len(authors) > settings.POSTS_FEED_PULL_SOURCES:
+        pulled = [Post.objects.filter(author_id__in=authors)]
+    else:
+        pulled = [Post.objects.filter(author_id=pk) for pk in authors]
+    sources += [
+        posts.annotate(feed_date=F('pub_date'), feed_post=F('pk'))
+        for posts in pulled
+    ]
+    return sources
@@ -0,0 +1,205 @@
+"""Лента популярных постов.
+
+Рейтинг поста складывается из событий: публикации (вес 1 плюс вес
+подписчиков автора на момент публикации), комментариев и новых
+подписчиков автора. Вес каждого события уменьшается вдвое за
+`POSTS_TRENDING_HALF_LIFE` секунд. Затухание общее для всех постов,
+поэтому старые вклады не пересчитываются: новое событие получает вес
+2^(t / half_life), растущий со временем, и порядок постов остаётся тем
+же. Чтобы числа не переполнялись, хранится двоичный логарифм суммы.
+
+Рейтинг обновляется при создании постов, комментариев и подписок, а
+лента читает первые записи индекса trending_score_idx. Посты старше
+`POSTS_TRENDING_WINDOW` секунд в рейтинг не попадают; `prune` убирает
+их из таблицы, `rebuild` пересчитывает её по базе.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .counters import get_user_stats
+from .models import Comment, Post, TrendingScore, UserStats
+
+BATCH_SIZE = 500  # Размер пачки при пересчёте рейтинга
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def contribution(weight, when):
+    """Логарифм вклада события веса weight в момент when."""
+    age = (when - EPOCH).total_seconds()
+    return math.log2(weight) + age / settings.POSTS_TRENDING_HALF_LIFE
+
+
+def add(score, value):
+    """log2(2^score + 2^value) без вычисления самих степеней."""
+    if score is None:
+        return value
+    high, low = max(score, value), min(score, value)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def cutoff():
+    """Дата, раньше которой посты не попадают в рейтинг."""
+    return timezone.now() - timedelta(
+        seconds=settings.POSTS_TRENDING_WINDOW
+    )
+
+
+def _post_weight(followers):
+    return 1 + settings.POSTS_TRENDING_FOLLOWER_WEIGHT * followers
+
+
+def score_post(post):
+    """Начальный рейтинг нового поста."""
+    if post.pub_date < cutoff():
+        return
+    followers = get_user_stats(post.author).followers_count
+    TrendingScore.objects.update_or_create(
+        post=post,
+        defaults={
+            'score': contribution(_post_weight(followers), post.pub_date)
+        },
+    )
+
+
+def _bump(scores, weight, when):
+    """Добавляет событие к рейтингам. Вызывается в транзакции
+    сохранения записи."""
+    if weight <= 0:
+        return
+    value = contribution(weight, when)
+    scores = list(scores.select_for_update())
+    for trending in scores:
+        trending.score = add(trending.score, value)
+    TrendingScore.objects.bulk_update(scores, ['score'])
+
+
+def score_comment(comment):
+    _bump(
+        TrendingScore.objects.filter(post_id=comment.post_id),
+        settings.POSTS_TRENDING_COMMENT_WEIGHT,
+        comment.created,
+    )
+
+
+def score_follow(follow):
+    """Новый подписчик поднимает посты автора, которые ещё
+    в рейтинге."""
+    _bump(
+        TrendingScore.objects.filter(post__author_id=follow.author_id),
+        settings.POSTS_TRENDING_FOLLOWER_WEIGHT,
+        timezone.now(),
+    )
+
+
+def score_posts(posts):
+    """Как score_post для пачки постов."""
+    since = cutoff()
+    posts = [post for post in posts if post.pub_date >= since]
+    followers = dict(UserStats.objects.filter(
+        user_id__in={post.author_id for post in posts}
+    ).values_list('user_id', 'followers_count'))
+    TrendingScore.objects.bulk_create(
+        (
+            TrendingScore(post_id=post.pk, score=contribution(
+                _post_weight(followers.get(post.author_id, 0)),
+                post.pub_date,
+            ))
+            for post in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _bump_many(scores, values):
+    """Добавляет к рейтингам постов вклады из values: id поста ->
+    логарифмы вкладов."""
+    scores = list(scores.select_for_update())
+    for trending in scores:
+        for value in values[trending.post_id]:
+            trending.score = add(trending.score, value)
+    TrendingScore.objects.bulk_update(
+        scores, ['score'], batch_size=BATCH_SIZE
+    )
+
+
+def score_comments(comments):
+    """Как score_comment для пачки комментариев."""
+    weight = settings.POSTS_TRENDING_COMMENT_WEIGHT
+    if weight <= 0:
+        return
+    values = defaultdict(list)
+    for comment in comments:
+        values[comment.post_id].append(contribution(weight, comment.created))
+    _bump_many(TrendingScore.objects.filter(post_id__in=values), values)
+
+
+def score_follows(follows):
+    """Как score_follow для пачки подписок: подписчики, пришедшие
+    к автору одновременно, складываются в одно событие."""
+    weight = settings.POSTS_TRENDING_FOLLOWER_WEIGHT
+    if weight <= 0:
+        return
+    now = timezone.now()
+    followers = Counter(follow.author_id for follow in follows)
+    scores = TrendingScore.objects.filter(post__author_id__in=followers)
+    values = {
+        pk: [contribution(weight * followers[author_id], now)]
+        for pk, author_id in scores.values_list('post_id', 'post__author_id')
+    }
+    _bump_many(scores, values)
+
+
+def prune():
+    """Удаляет рейтинги постов, вышедших из окна. Возвращает их
+    количество."""
+    stale = Post.objects.filter(pub_date__lt=cutoff()).values('pk')
+    return TrendingScore.objects.filter(post__in=stale).delete()[0]
+
+
+def rebuild():
+    """Пересчитывает рейтинг по базе, например после массовой загрузки.
+
+    Время подписок не хранится, поэтому все подписчики автора
+    учитываются как бывшие у него на момент публикации.
+    """
+    since = cutoff()
+    posts = Post.objects.filter(pub_date__gte=since).values_list(
+        'pk', 'pub_date', 'author__stats__followers_count'
+    )
+    scores = {
+        pk: contribution(_post_weight(followers or 0), pub_date)
+        for pk, pub_date, followers in posts.iterator()
+    }
+    weight = settings.POSTS_TRENDING_COMMENT_WEIGHT
+    if weight > 0:
+        comments = Comment.objects.filter(
+            post__pub_date__gte=since
+        ).values_list('post_id', 'created')
+        for post_id, created in comments.iterator():
+            if post_id in scores:
+                scores[post_id] = add(
+                    scores[post_id], contribution(weight, created)
+                )
+    TrendingScore.objects.all().delete()
+    TrendingScore.objects.bulk_create(
+        (
+            TrendingScore(post_id=pk, score=score)
+            for pk, score in scores.items()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return len(scores)
+
+
+def get_trending():
+    """Посты в порядке убывания рейтинга. Рейтинги - вещественные
+    числа с вкладом даты публикации до микросекунд, поэтому второе поле
+    сортировки не нужно: с ним SQLite досортировывал бы строки."""
+    return Post.objects.filter(trending__isnull=False).order_by(
+        '-trending__score'
+    )
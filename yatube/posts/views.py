@@ -1,34 +1,100 @@
+from urllib.parse import urlencode
+
+from django.core.paginator import Paginator
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
 
-from .models import Follow, Post, Group, User
+from core.asgi import streams_enabled
+from core.broker import ClientLimitExceeded, TooManySubscribers, broker
+from core.throttling import client_id, throttle
+
+from .models import Comment, Follow, Post, Group, User
+from .caching import (
+    FEED_VERSION_KEY, GROUP_PAGE_VERSION_KEY, GROUPS_PAGE_VERSION_KEY,
+    POST_PAGE_VERSION_KEY,
+    PROFILE_PAGE_VERSION_KEY, anonymous_page_cache, feed_cache_context,
+    feed_fill, feed_fragment_cached, page_condition, post_dependencies,
+)
+from .counters import get_user_stats
+from .exporter import FIELDS, FORMATS, export
 from .forms import PostForm, CommentForm
+from .group_stats import get_directory
+from .paginators import CursorPaginator, get_page_obj
+from .search import get_search_backend
+from .streams import NewPostsStream, feed_source
+from .thumbnails import schedule as schedule_thumbnail
+from .timeline import FEED_ORDERING, get_feed
+from .trending import get_trending
 
 
 COUNT = 10  # Количество постов на странице
+COMMENTS_COUNT = 20  # Количество комментариев на странице
+TRENDING_COUNT = 20  # Количество постов в ленте популярного
+GROUPS_COUNT = 20  # Количество групп на странице каталога
+
+
+def feed_page(cached, get_page):
+    """Страница ленты. Из закэшированного фрагмента ленты страница
+    не выводится, поэтому тогда она читается из базы, только если
+    к ней обратятся."""
+    if cached:
+        return SimpleLazyObject(get_page)
+    return get_page()
 
 
+@anonymous_page_cache(FEED_VERSION_KEY)
 def index(request):
-    posts_list = Post.objects.all()
-    paginator = Paginator(posts_list, COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    template = 'posts/index.html'  # Шаблон
-    index = True
+    cached = feed_fragment_cached('index_page', request)
+    with feed_fill(cached):
+        posts_list = Post.objects.for_feed()
+        page_obj = feed_page(
+            cached, lambda: get_page_obj(request, posts_list, COUNT)
+        )
+        template = 'posts/index.html'  # Шаблон
+        index = True
+        context = {
+            'page_obj': page_obj,
+            'index': index,
+            **feed_cache_context(request),
+        }
+        return render(request, template, context)
+
+
+@anonymous_page_cache(FEED_VERSION_KEY)
+def popular(request):
+    """Первые посты рейтинга: читаются по индексу рейтинга, без
+    подсчёта и сортировки всех постов."""
+    posts = get_trending().for_feed()[:TRENDING_COUNT]
+    template = 'posts/popular.html'  # Шаблон
+    popular = True
+    context = {
+        'posts': posts,
+        'popular': popular,
+    }
+    return render(request, template, context)
+
+
+@anonymous_page_cache(GROUPS_PAGE_VERSION_KEY)
+def group_index(request):
+    """Каталог групп по сводке, которую пересчитывает aggregate_groups."""
+    paginator = Paginator(get_directory(), GROUPS_COUNT)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    template = 'posts/group_index.html'  # Шаблон
     context = {
         'page_obj': page_obj,
-        'index': index,
     }
     return render(request, template, context)
 
 
+@page_condition(GROUP_PAGE_VERSION_KEY)
+@anonymous_page_cache(GROUP_PAGE_VERSION_KEY)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts_list = group.posts.all()
-    paginator = Paginator(posts_list, COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts_list = group.posts.for_feed()
+    page_obj = get_page_obj(request, posts_list, COUNT)
     template = 'posts/group_list.html'  # Шаблон
     context = {
         'group': group,
@@ -37,12 +103,12 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@page_condition(PROFILE_PAGE_VERSION_KEY)
+@anonymous_page_cache(PROFILE_PAGE_VERSION_KEY)
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    posts = user.posts.all()
-    paginator = Paginator(posts, COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = user.posts.for_feed()
+    page_obj = get_page_obj(request, posts, COUNT)
     is_auth = request.user.is_authenticated
     is_exists = Follow.objects.filter(
         user__id=request.user.id,
@@ -53,28 +119,68 @@ def profile(request, username):
     context = {
         'author': user,
         'posts': posts,
+        'stats': get_user_stats(user),
         'page_obj': page_obj,
         'following': following
     }
     return render(request, template, context)
 
 
+@page_condition(POST_PAGE_VERSION_KEY, post_dependencies)
+@anonymous_page_cache(POST_PAGE_VERSION_KEY, post_dependencies)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm(
         request.POST or None,
     )
-    comments = post.comments.all()
     template = 'posts/post_detail.html'  # Шаблон
     context = {
         'post': post,
+        'author_stats': get_user_stats(post.author),
         'form': form,
-        'comments': comments,
+        'comments': get_comments_page(request, post.pk),
+    }
+    return render(request, template, context)
+
+
+def get_comments_page(request, post_id):
+    """Страница комментариев поста от новых к старым по курсору."""
+    comments = Comment.objects.filter(post_id=post_id).for_thread()
+    paginator = CursorPaginator(
+        comments, COMMENTS_COUNT, ordering=('-created', '-pk')
+    )
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def post_comments(request, post_id):
+    """Следующая страница комментариев: фрагмент для подгрузки
+    на странице поста."""
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    template = 'includes/comments.html'  # Шаблон
+    context = {
+        'post_id': post_id,
+        'comments': get_comments_page(request, post_id),
+    }
+    return render(request, template, context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts_list = get_search_backend().search(query).for_feed()
+    page_obj = get_page_obj(request, posts_list, COUNT)
+    template = 'posts/search.html'  # Шаблон
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'query_prefix': urlencode({'q': query}) + '&',
     }
     return render(request, template, context)
 
 
 @login_required
+@throttle('post_create')
 def post_create(request):
     form = PostForm(
         request.POST or None,
@@ -84,6 +190,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        schedule_thumbnail(post.image)
         return redirect('posts:profile', request.user)
     template = 'posts/create_post.html'  # Шаблон
     context = {
@@ -103,7 +210,8 @@ def post_edit(request, post_id):
     if post.author != request.user:
         return redirect('posts:post_detail', post.pk)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        schedule_thumbnail(post.image)
         return redirect('posts:post_detail', post.pk)
     is_edit = True
     template = 'posts/create_post.html'  # Шаблон
@@ -115,6 +223,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@throttle('add_comment')
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -126,23 +235,63 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def get_follow_page(request, user):
+    """Страница ленты подписок пользователя."""
+    sources = [posts.for_feed() for posts in get_feed(user)]
+    if len(sources) == 1:
+        sources = sources[0]
+    return get_page_obj(request, sources, COUNT, FEED_ORDERING)
+
+
 @login_required
 def follow_index(request):
     user = request.user
-    posts = Post.objects.filter(author__following__user=user)
-    paginator = Paginator(posts, COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    template = 'posts/follow.html'  # Шаблон
-    follow = True
-    context = {
-        'page_obj': page_obj,
-        'follow': follow,
-    }
-    return render(request, template, context)
+    cached = feed_fragment_cached('follow_index_page', request, user)
+    with feed_fill(cached, user):
+        page_obj = feed_page(cached, lambda: get_follow_page(request, user))
+        template = 'posts/follow.html'  # Шаблон
+        follow = True
+        context = {
+            'page_obj': page_obj,
+            'follow': follow,
+            **feed_cache_context(request, user),
+        }
+        return render(request, template, context)
+
+
+def new_posts(request, feed):
+    """Поток server-sent events о новых постах ленты.
+
+    Под WSGI поток занял бы рабочий процесс сервера, поэтому
+    отвечаем 204: получив его, браузер не переподключается."""
+    if not streams_enabled(request):
+        return HttpResponse(status=204)
+    if feed == 'follow' and not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    try:
+        after = int(request.GET['after'])
+    except (KeyError, ValueError):
+        after = None
+    channels, posts = feed_source(feed, request.user)
+    try:
+        subscription = broker.subscribe(channels, client_id(request))
+    except TooManySubscribers as error:
+        status = 429 if isinstance(error, ClientLimitExceeded) else 503
+        response = HttpResponse(status=status)
+        response['Retry-After'] = settings.STREAM_HEARTBEAT
+        return response
+    response = StreamingHttpResponse(
+        NewPostsStream(subscription, posts, after),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен копить события в буфере
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
+@throttle('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     user = request.user
     author = User.objects.get(username=username)
@@ -155,6 +304,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@throttle('follow', methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -162,3 +312,21 @@ def profile_unfollow(request, username):
         user=user, author=author
     ).delete()
     return redirect('posts:profile', username)
+
+
+@login_required
+def export_data(request):
+    """Выгрузка постов или комментариев текущего пользователя."""
+    kind = request.GET.get('kind', 'posts')
+    export_format = request.GET.get('format', 'jsonl')
+    if kind not in FIELDS or export_format not in FORMATS:
+        raise Http404
+    user = request.user
+    response = StreamingHttpResponse(
+        export(user, kind, export_format),
+        content_type=FORMATS[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{export_format}"'
+    )
+    return response
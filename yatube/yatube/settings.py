@@ -27,6 +27,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +59,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+ASGI_APPLICATION = 'yatube.asgi.application'
 
 
 DATABASES = {
@@ -66,6 +69,8 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -110,10 +115,145 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Общий кэш для нескольких процессов (gunicorn с несколькими воркерами):
+# memcached по адресу SHARED_CACHE_LOCATION (нужен пакет python-memcached),
+# перед ним LRU в памяти каждого процесса. Общий уровень должен атомарно
+# выполнять incr и add - на них держатся версии кэша: файловый кэш и кэш
+# в базе делают это чтением и записью, а файловый ещё и медленно
+# вычищает старые записи, поэтому проверка core.E002 их не допускает
+SHARED_CACHE = False
+SHARED_CACHE_LOCATION = '127.0.0.1:11211'
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                # Ключей в памяти процесса и сколько секунд они там живут
+                'MAX_ENTRIES': 1000,
+                'LOCAL_TIMEOUT': 5,
+            },
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': SHARED_CACHE_LOCATION,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+# Курсорная пагинация лент вместо постраничной (?cursor= вместо ?page=)
+POSTS_CURSOR_PAGINATION = False
+
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подтягиваются при чтении ленты подписок
+POSTS_FANOUT_FOLLOWERS_LIMIT = 5000
+# Раскладка постов бывшего популярного автора возобновляется командой
+# resume_fanout, когда подписчиков становится не больше этого числа:
+# подписки и отписки на границе не переключают режим туда и обратно
+POSTS_FANOUT_RESUME_LIMIT = 4000
+# Сколько последних постов автора добавляется в ленту каждого подписчика
+# при возобновлении раскладки
+POSTS_TIMELINE_REPUSH = 20
+# Сколько популярных авторов ленты подписок читается отдельными
+# запросами по индексу автора; посты остальных - одним запросом
+POSTS_FEED_PULL_SOURCES = 10
+# Сколько последних постов автора добавляется в ленту при подписке
+POSTS_TIMELINE_BACKFILL = 1000
+
+# Время жизни фрагментов лент: они сбрасываются сменой версии при изменении
+# постов, комментариев и подписок, поэтому могут жить долго
+POSTS_FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Число процессов, создающих миниатюры картинок постов в фоне;
+# при 0 миниатюры создаются в основном процессе после сохранения поста
+POSTS_THUMBNAIL_WORKERS = 2
+
+# Бэкенд полнотекстового поиска по постам: posts.search.SQLiteFTSBackend
+# для SQLite, posts.search.DatabaseSearchBackend для остальных баз
+POSTS_SEARCH_BACKEND = 'posts.search.SQLiteFTSBackend'
+
+# Доля запросов, которые профилируются (заголовок Server-Timing, лог
+# core.profiling и сводка на /profiling/); при 0 профилирование выключено
+PROFILING_SAMPLE_RATE = 0
+
+# Прагмы, которые выполняются на каждом новом соединении с SQLite:
+# журнал WAL не даёт записи блокировать чтение, synchronous=NORMAL
+# в режиме WAL сбрасывает данные на диск только при контрольных точках,
+# cache_size в КиБ (отрицательное значение), mmap_size в байтах,
+# busy_timeout в миллисекундах
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+# Псевдонимы баз из DATABASES, из которых читают запросы GET; пустой
+# список - всё читается из default
+DATABASE_REPLICAS = []
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_PIN_SECONDS = 5
+# На сколько секунд реплики могут отставать: столько времени после смены
+# версии кэша страницы и фрагменты заполняются чтением из основной базы
+REPLICA_MAX_LAG = 5
+
+# Время жизни страниц для анонимных посетителей: страницы сбрасываются
+# сигналами при изменении постов, комментариев и групп, а этот срок
+# ограничивает устаревание остального (имён авторов, счётчиков);
+# при 0 страницы не кэшируются
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Ограничения частоты запросов, изменяющих данные: 'N/период' (s, m, h, d),
+# ведро на N запросов заполняется N токенами за период; None - без
+# ограничения
+THROTTLE_RATES = {
+    'post_create': '10/m',
+    'add_comment': '20/m',
+    'follow': '30/m',
+    'signup': '5/h',
+}
+# Во сколько раз ведро IP для авторизованных пользователей больше их
+# собственного: за одним адресом (NAT, офис) бывает несколько человек
+THROTTLE_IP_MULTIPLIER = 5
+# Адреса и сети обратных прокси, которым можно верить в X-Forwarded-For;
+# без них IP клиента - адрес соединения
+TRUSTED_PROXIES = []
+
+# Потоки, в которых ASGI-приложение выполняет представления: столько
+# запросов одновременно работают с базой, остальные соединения ждут
+# в цикле событий
+ASGI_THREADS = 20
+# Потоки для потоковых ответов (выгрузки, server-sent events): каждый
+# ответ читается одним потоком этого пула от начала до закрытия
+ASGI_STREAM_THREADS = 50
+
+# Потоки новых постов (server-sent events), открываются только под ASGI:
+# сколько соединений держит процесс и один клиент, сколько событий
+# копится для медленного клиента, период пустых сообщений и время жизни
+# потока в секундах. Каждое соединение занимает поток ASGI_STREAM_THREADS,
+# поэтому STREAM_MAX_CONNECTIONS меньше его: остальные потоки остаются
+# выгрузкам. Брокер живёт в памяти процесса, и поток узнаёт только
+# о постах, опубликованных тем же процессом: при нескольких процессах
+# сервера счётчик новых постов неполон
+STREAM_MAX_CONNECTIONS = 40
+STREAM_MAX_PER_CLIENT = 5
+STREAM_BUFFER_SIZE = 100
+STREAM_HEARTBEAT = 15
+STREAM_TIMEOUT = 60 * 5
+
+# Лента популярного: за сколько секунд вес события падает вдвое, какие
+# посты ещё участвуют в рейтинге, вес комментария и подписчика автора
+# относительно самой публикации
+POSTS_TRENDING_HALF_LIFE = 60 * 60 * 12
+POSTS_TRENDING_WINDOW = 60 * 60 * 24 * 7
+POSTS_TRENDING_COMMENT_WEIGHT = 1.0
+POSTS_TRENDING_FOLLOWER_WEIGHT = 0.02